@@ -1,10 +1,12 @@
-import yfinance as yf
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime
 from pypfopt import EfficientFrontier
 from pypfopt import risk_models
 from pypfopt import expected_returns
+from quant_tools.cache import PriceStore
+from quant_tools.data import load_prices
+from quant_tools.portfolio import clean_weights, portfolio_returns, rebalance_max_sharpe
 
 # Goal: make a list with the tickers that we want the data for
 
@@ -20,14 +22,18 @@ tickers = ["SPY", "SPMO", "SPHQ", "SPHB"]
 # from October 12th 2015 till yesterday [we'll use datetime to do this]
 # using today is enough, because yfinance will only supply us with data till yesterday
 
+# the prices are downloaded with yfinance and saved in a local price store
+# => if you run the script again, only the days that are missing are downloaded
+
 today = datetime.today().strftime('%Y-%m-%d')
-data = yf.download(tickers, start="2015-10-12", end=today)
+price_store = PriceStore("price_store/yahoo")
 
 
-# Goal: Extract the losing prices for each ticker from our dataframe "data"
+# Goal: Get the closing prices for each ticker
 # turn it into a new dataframe called "df"
 
-df = data["Close"]
+close = load_prices(tickers, start="2015-10-12", end=today, source="yahoo", field="close", store=price_store)
+df = close
 
 
 # Goal: find portfolio (weights) that maximises the Sharpe Ratio (remember: a important measure for risk-adjusted returns)
@@ -43,6 +49,11 @@ returns = expected_returns.mean_historical_return(df)
 # calculate the covariances between the assets
 covariance = risk_models.sample_cov(df)
 
+# other estimators of the covariances: Ledoit-Wolf shrinkage (more stable with many assets) or exponentially weighted (recent days count more)
+    # from quant_tools.covariance import ewma_cov, ledoit_wolf
+    # covariance = ledoit_wolf(df)
+    # covariance = ewma_cov(df, span=180)
+
 # we'll use Efficient Frontier for our optimization, "providing" the expected returns and the covariances as the arguments
 ef = EfficientFrontier(returns, covariance)
 
@@ -58,25 +69,41 @@ cleaned_weightings = ef.clean_weights()
 statistics = ef.portfolio_performance() 
 
 
+# Goal: rolling rebalancing -> re-optimize the weights at the end of every month, only with the data we had at that point
+    # the weights above use the whole history, so they already "know" which factor did well
+
+# None uses all the data up to the rebalancing date, a number of days (e.g. 756 = 3 years) uses a rolling window
+rebalance_window = None
+
+# one row of weights per month end, they're used from the next trading day on
+monthly_weightings = clean_weights(rebalance_max_sharpe(df, window=rebalance_window, freq="M", risk_free_rate=0.02))
+
+
 # Goal: Get daily simple return of our portfolio given the weightings -> then turn into log returns for symmetry and time additivity
 
 # calculate percentage change in regard to last period for every column
 df = df.pct_change()
 
 # calculate simple return of our portfolio given daily returns for each asset and their weighting
-df["portfolio simple return"] = df["SPHB"] * cleaned_weightings["SPHB"] + df["SPMO"] * cleaned_weightings["SPMO"] + df["SPHQ"] * cleaned_weightings["SPHQ"] 
+# (one matrix-vector product of the daily returns and the weights, works the same for thousands of assets)
+df["portfolio simple return"] = portfolio_returns(df, cleaned_weightings)
 
 # turn simple returns into log returns
 df["portfolio log return"] = np.log(1 + df["portfolio simple return"]) 
 
+# same for the monthly rebalanced portfolio: hold the weights of the last month end (no return before the first one)
+    # drift=True lets the weights move with the prices during the month instead of resetting them every day
+df["rebalanced log return"] = np.log(1 + portfolio_returns(df, monthly_weightings, drift=False))
+
 # turn SPY closing prices into daily returns
-df["spy log return"] = np.log(data["Close"]["SPY"]).diff() 
+df["spy log return"] = np.log(close["SPY"]).diff() 
 
 # fills NaN values with 0 -> needed since pct_change for first period is NaN
 df.fillna(0, inplace=True)
 
 # plot our portfolio against the spy
 plt.plot(np.exp(df["portfolio log return"]).cumprod(), label = "Return of Our Portfolio")
+plt.plot(np.exp(df["rebalanced log return"]).cumprod(), label = "Return of Our Portfolio (Monthly Rebalanced)")
 plt.plot(np.exp(df["spy log return"]).cumprod(), label = "Return  of Spy")
 plt.legend(loc=2)
 plt.title('Our Factor Portfolio against the SPY')
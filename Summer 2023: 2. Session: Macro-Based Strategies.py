@@ -2,20 +2,23 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import datetime
+from quant_tools.streaming import MacroSignalStream, replay_feed
+from quant_tools.ingest import load_table
 
 # Goal: create a dataframe from the excel file that we've stored our data in
 
 # to do this download the df_2 excel file from this repository and save it on your pc
-# then copy the path of the file into the quotes
+# then copy the path of the file into the quotes (or put the file into the folder of $QUANT_DATA_DIR, default: "data")
 # if you don't know how to obtain the path of a file here are some sites that can help you:
         # Mac: https://setapp.com/how-to/how-to-find-the-path-of-a-file-in-mac
         # Windows: https://www.howtogeek.com/670447/how-to-copy-the-full-path-of-a-file-on-windows-10/
 
 # use the commodities excel if you also want oil, else use the regular one
-df = pd.read_excel(r"[insert file path here]") 
+data_path = r"[insert file path here]"
 
-# now we set the date as our index; this will help us later (when we plot it)
-df = df.set_index('date')
+# now we read in the data with the date as our index; this will help us later (when we plot it)
+    # the excel file gets converted into a parquet file on the first run, which is a lot faster to read afterwards
+df = load_table(data_path)
 
 
 # strategy: long gold if 10-year lower, short gold if 10-year higher (than last week, can be adapted to monthly etc.)
@@ -124,3 +127,20 @@ print('Correlation between Gold and Treasury:',corr_gold_treasury)
 
 
 
+
+
+# Goal: run the strategy "live" - every new week only updates the signal and the performance,
+# instead of re-reading the whole excel file and calculating everything again (see quant_tools.streaming)
+
+# here we replay our dataframe week by week, in real life the feed would be a data source that gets a new bar every week
+# we use the same 36 weeks as above to annualize the volatility
+
+async def run_live(df):
+    stream = MacroSignalStream(periods_per_year=36)
+    async for date, state in stream.consume(replay_feed(df, yield_column='10-yr', price_column='gold')):
+        pass # this is where we would e.g. print(date, state['signal']) or send an order to our broker
+    return state
+
+# 'uncomment' the following lines to run it (in a jupyter notebook use: live_state = await run_live(df))
+    # import asyncio
+    # live_state = asyncio.run(run_live(df))
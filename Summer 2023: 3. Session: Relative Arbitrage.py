@@ -2,6 +2,10 @@ import pandas as pd
 import numpy as np 
 import datetime
 import matplotlib.pyplot as plt
+from quant_tools.signals import decode
+from quant_tools.bands import walk_forward_bands
+from quant_tools.backtest import LONG_BOTH, LONG_SPY, SIGNAL_LABELS, leg_returns, ratio_signal, run_backtest, strategy_positions
+from quant_tools.ingest import load_table
 
 # display decimals to third place
 pd.set_option('display.float_format', lambda x: '%.3f' % x)
@@ -10,12 +14,16 @@ pd.set_option('display.float_format', lambda x: '%.3f' % x)
 # (don't do it if your PC is slow)
 pd.set_option('display.max_rows', None)
 
-# read in excel file as our dataframe
-    # if you've forgotten how to do it, look into last sessions code
-df = pd.read_excel(r"/Users/erikfriedrich/Downloads/df_session3.xlsx")
+# path of the excel file (or of its parquet copy), relative paths are looked up in $QUANT_DATA_DIR (default: "data")
+data_path = "df_session3.xlsx"
 
-# make date column the index
-df = df.set_index('date')
+# this cuts off all the data before the year 2000 - this is useful, if you want to look at specific intervals
+# we do this while reading because it helps with computational time and the timeframe has an effect on the average relative value of silver to gold etc.
+data_start = '2000-01-01'
+
+# read in our data with the date as index (only the columns we need)
+    # the excel file gets converted into a parquet file on the first run, which is a lot faster to read afterwards
+df = load_table(data_path, columns=['gold', 'silver', 'spy'], start=data_start)
 
 
 # Strategy:
@@ -26,35 +34,23 @@ df = df.set_index('date')
         # if relative < avg-1,5*std we'll go long gold, short silver
     # if the avg-std <= relative <= avg+std we'll (1) hold the s&p 500 or (2) go long silver and gold
         # make a new column with the relative value of gold to silver
-        
-# this cuts off all the data before the year 2000 - this is useful, if you want to look at specific intervals
-# we do this now because it helps with computational time and the timeframe has an effect on the average relative value of silver to gold etc.
-df = df.truncate(before = '2000-01-01')
+
 
 # get relative value of siler to gold
 df["relative"] = df['gold']/df['silver']
 
-# make two new columns with the log returns of each asset
+# make three new columns with the log returns of each asset
 df['spy return'] = np.log(df['spy']).diff()
 df["gold return"] = np.log(df["gold"]).diff()
 df["silver return"] = np.log(df["silver"]).diff()
 
-# simple return if we go long gold with half our portfolio and short silver with the other half
-    # the one in the brackets indicates how many periods back we go
-        # try to experiment with different values
-        
-df['simple long gold'] = 0.5 * df['gold'].pct_change(1) - 0.5 * df['silver'].pct_change(1)
-
-# simple return if we go short gold with half our portfolio and long silver with the other
-df['simple short gold'] = (-0.5) * df['gold'].pct_change(1) + 0.5 * df['silver'].pct_change(1)
-
-# get the return if we're long both -> if the relative value of gold and silver is within our acceptible bandwith
-df['long both'] = 0.5*df['gold'].pct_change(1) + 0.5*df["silver"].pct_change(1)
-
-# turn all the simple returns into log returns
-df["log long both"] = np.log(df['long both'] + 1)
-df['log long gold'] = np.log(df['simple long gold'] + 1)
-df['log short gold'] = np.log(df['simple short gold'] + 1)
+# get the (log) returns of every "leg" our strategies can hold (see quant_tools.backtest):
+    # long gold with half our portfolio and short silver with the other half
+    # short gold with half our portfolio and long silver with the other
+    # long both -> if the relative value of gold and silver is within our acceptible bandwith
+    # the spy
+# the simple returns of gold and silver are calculated with pct_change(1) and then turned into log returns
+legs = leg_returns(df['gold'], df['silver'], df['spy'])
 
 # out of interest
 # calculate correlation between gold and silver ( around 0.9 )
@@ -72,17 +68,39 @@ std = df['relative'].std()
 ceiling = avg+1.5*std
 floor = avg-1.5*std
 
-# make our trading signals based on that
-df['signal'] = np.where(df["relative"] > ceiling, "short gold long silver", "long spy")
-df['signal'] = np.where(df["relative"] < floor, "long gold short silver", df['signal'])
+# careful: avg and std are calculated over the whole timeframe => on every day we use information from the future (look-ahead)
+# for an honest backtest set band_window: the bands of each day are then only calculated from the data up to that day
+    # e.g. 252*5 for the last 5 years, "expanding" for all data up to that day
+    # band_refit re-estimates the bands only every n days (e.g. 21 => monthly)
+band_window = None
+band_refit = 1
 
-# get the returns of our trading strategy depending on the signal
+if band_window is not None:
+    ceiling, floor = walk_forward_bands(df['relative'], window=None if band_window == "expanding" else band_window,
+                                        z_ceiling=1.5, z_floor=1.5, refit_every=band_refit)
 
-df['strategy 1'] = np.where(df['signal'] == "short gold long silver", (-1)*df['log short gold'], df['spy return'])
-df['strategy 1'] = np.where(df['signal'] == "long gold short silver", (-1)*df['log long gold'], df['strategy 1'])
-
-df['strategy 2'] = np.where(df['signal'] == "short gold long silver", df['log short gold'], df['log long both'])
-df['strategy 2'] = np.where(df['signal'] == "long gold short silver", df['log long gold'], df['strategy 2'])
+# make our trading signals based on that
+    # the signal is stored as a small integer: NEUTRAL (0), ABOVE_CEILING (1) => short gold long silver, BELOW_FLOOR (2) => long gold short silver
+df['signal'] = ratio_signal(df["relative"], ceiling, floor)
+
+# if you want to read the signals as text, decode them
+    # this is only for displaying them, the strategies below work with the integer codes
+signal_counts = decode(df['signal'], SIGNAL_LABELS).value_counts()
+print(signal_counts)
+
+# get the returns of our trading strategies depending on the signal
+    # strategy 1: hold the spy if there's no signal (the pair trade is taken in the opposite direction => pair_direction -1)
+    # strategy 2: hold gold and silver if there's no signal
+# every strategy is one column of positions (which leg we hold on each day), all of them are backtested at once
+
+positions = np.column_stack([
+    strategy_positions(df['signal'].to_numpy(), fallback=LONG_SPY),
+    strategy_positions(df['signal'].to_numpy(), fallback=LONG_BOTH),
+])
+strategy_returns = run_backtest(legs, positions, pair_direction=[-1, 1])
+
+df['strategy 1'] = strategy_returns[:, 0]
+df['strategy 2'] = strategy_returns[:, 1]
 
 # fill in NaN values with 0
 df.fillna(0, inplace = True)
@@ -9,6 +9,13 @@ import numpy as np
 import datetime
 import matplotlib.pyplot as plt
 from scipy.stats import skew, kurtosis
+from quant_tools.bands import walk_forward_bands
+from quant_tools.backtest import LONG_BOTH, LONG_SPY, leg_returns, ratio_signal, run_backtest, strategy_positions, vix_fallback
+from quant_tools.analytics import alpha_beta, annual_return, annual_volatility, sharpe_ratio
+from quant_tools.ingest import load_table
+from quant_tools.online import OnlineMoments
+from quant_tools.simulation import simulate
+from quant_tools.tail_risk import rolling_var_es, var_es
 
 # display numbers to the third decimal place
 pd.set_option('display.float_format', lambda x: '%.3f' % x)
@@ -16,31 +23,23 @@ pd.set_option('display.float_format', lambda x: '%.3f' % x)
 # print out all rows of a dataframe
 pd.set_option('display.max_rows', None)
 
-# read in excel file as our dataframe
-df = pd.read_excel(r"C:\Users\Erik\Downloads\df_session4.xlsx")
+# path of the excel file (or of its parquet copy), relative paths are looked up in $QUANT_DATA_DIR (default: "data")
+data_path = "df_session4.xlsx"
 
-# make date column the index
-df = df.set_index('date')
-
-# this cuts off all the data before 2000
-df = df.truncate(before = '2000-01-01')
+# read in our data with the date as index, only the columns we need and only the data from 2000 on
+    # the excel file gets converted into a parquet file on the first run, which is a lot faster to read afterwards
+df = load_table(data_path, columns=['gold', 'silver', 'spy', 'vix'], start='2000-01-01')
 
 # make a new column with the relative value of gold to silver
 df["relative"] = df['gold']/df['silver']
 
-# make two new columns with the log returns of each asset
+# make three new columns with the log returns of each asset
 df['spy return'] = np.log(df['spy']).diff()
 df["gold return"] = np.log(df["gold"]).diff()
 df["silver return"] = np.log(df["silver"]).diff()
 
-df['simple long gold'] = 0.5 * df['gold'].pct_change(1) - 0.5 * df['silver'].pct_change(1)
-df['simple short gold'] = (-0.5) * df['gold'].pct_change(1) + 0.5 * df['silver'].pct_change(1)
-
-df['long both'] = 0.5*df['gold'].pct_change(1) + 0.5*df["silver"].pct_change(1)
-df["log long both"] = np.log(df['long both'] + 1)
-
-df['log long gold'] = np.log(df['simple long gold'] + 1)
-df['log short gold'] = np.log(df['simple short gold'] + 1)
+# log returns of every "leg" our strategies can hold: short gold long silver, long gold short silver, spy, long both
+legs = leg_returns(df['gold'], df['silver'], df['spy'])
 
 # calculate the average gold to silver ratio [around 69 in this timeframe]
 avg = df['relative'].mean(axis=0)
@@ -57,22 +56,44 @@ std = df['relative'].std()
 ceiling = avg+1.5*std
 floor = avg-1.5*std
 
-# make our trading signals based on that
-df['signal'] = np.where(df["relative"] >= ceiling, "short gold long silver", "long spy")
-df['signal'] = np.where(df["relative"] <= floor, "long gold short silver", df['signal'])
+# careful: avg and std are calculated over the whole timeframe => on every day we use information from the future (look-ahead)
+# for an honest backtest set band_window: the bands of each day are then only calculated from the data up to that day
+    # e.g. 252*5 for the last 5 years, "expanding" for all data up to that day
+    # band_refit re-estimates the bands only every n days (e.g. 21 => monthly)
+band_window = None
+band_refit = 1
+
+if band_window is not None:
+    ceiling, floor = walk_forward_bands(df['relative'], window=None if band_window == "expanding" else band_window,
+                                        z_ceiling=1.5, z_floor=1.5, refit_every=band_refit)
 
-# get the returns of our trading strategy depending on the signal
-df['strategy spy'] = np.where(df['signal'] == "short gold long silver", df['log short gold'], df['spy return'])
-df['strategy spy'] = np.where(df['signal'] == "long gold short silver", df['log long gold'], df['strategy spy'])
+# make our trading signals based on that (NEUTRAL, ABOVE_CEILING or BELOW_FLOOR, this time touching the band is enough)
+df['signal'] = ratio_signal(df["relative"], ceiling, floor, inclusive=True)
 
-df['strategy gs'] = np.where(df['signal'] == "short gold long silver", df['log short gold'], df['log long both'])
-df['strategy gs'] = np.where(df['signal'] == "long gold short silver", df['log long gold'], df['strategy gs'])
+# to read the signals as text (only for displaying them) use quant_tools.signals.decode(df['signal'], SIGNAL_LABELS)
+
+# get the returns of our trading strategies depending on the signal
+    # strategy spy: hold the spy if there's no signal
+    # strategy gs: hold gold and silver if there's no signal
 
 # this is where the New Part begins
 # make vix strategy, if above 30, we go long gold and long silver instead of long spy
     # thesis: market is to volatile/ unpredictable -> our investors want "safety"
+    # the vix overrides our signal on these days (calm=-1 means no override)
+
+signal = df['signal'].to_numpy()
+positions = np.column_stack([
+    strategy_positions(signal, fallback=LONG_SPY),
+    strategy_positions(signal, fallback=LONG_BOTH),
+    strategy_positions(signal, fallback=LONG_SPY, override=vix_fallback(df["vix"], level=30, calm=-1, stressed=LONG_BOTH)),
+])
 
-df["strategy vix"] = np.where(df["vix"] > 30, df["log long both"], df["strategy spy"])
+# all three strategies are backtested at once
+strategy_returns = run_backtest(legs, positions)
+
+df['strategy spy'] = strategy_returns[:, 0]
+df['strategy gs'] = strategy_returns[:, 1]
+df["strategy vix"] = strategy_returns[:, 2]
 
 # fill in NaN values with 0
 df.fillna(0, inplace = True)
@@ -88,50 +109,34 @@ plt.title("Our trading strategy against the S&P 500")
 plt.grid(True, alpha = .5)
 plt.show()
 
-# get annualized returns -> need the simple return 
-    # avg return -> 1 year
+# get annualized returns
+    # compound annual growth rate: the return per year that gets us from 1 to our final value
+    # our strategy returns are log returns => log=True
     
-strategy_vix_simple_return = np.exp(df["strategy vix"]) - 1
-strategy_vix_mean_simple_return = np.mean(strategy_vix_simple_return)
-
-annualized_return_strategy_vix = strategy_vix_mean_simple_return * 252 * 100 # tumes 100 for displaying purposes, it's obviously not mathematically correct
+annualized_return_strategy_vix = annual_return(df["strategy vix"], log=True) * 100 # times 100 for displaying purposes
 
 # volatility for 1 year, based on daily prices
     # 252 is approx. the number of trading days in a year
     # if you need a quick estimate u can use 256, because sqrt(256)=16 but mind you, it's a little bit overestimated then
 
-vola_vix = df['strategy vix'].std()*np.sqrt(252) * 100 # times 100 - again, for displaying purposes
+vola_vix = annual_volatility(df['strategy vix']) * 100 # times 100 - again, for displaying purposes
 
 
 # goal: calculate sharpe ratio
-risk_free_rate = 3 # should be 0.03 or 3%, but because we've multplied everything before with 100, we need to it again 
-sharpe_ratio_vix = (annualized_return_strategy_vix - risk_free_rate) / vola_vix
+    # (annualized return - risk free rate) / volatility
+risk_free_rate = 0.03
+sharpe_ratio_vix = sharpe_ratio(df["strategy vix"], risk_free_rate, log=True)
 # how do we view the sharpe ratio in our case [think as a portfolio manager, but also as an investor]
 
 
-# goal: calculate beta 
+# goal: calculate beta and alpha
+    # remember the CAPM from our first session?
 
-# calculate covariance between our strategy and the spy
 # the beta is defined as the covariance between the market returns and the individual returns of a stock (in our case the strategy) divided by the variance of the market returns
-covariance_vix = np.cov(df["strategy vix"], df["spy return"])[0][1]
-
-# calculate variance of spy 
-variance_spy = np.var(df['spy return'])
-
-# final computation
-beta_vix = covariance_vix / variance_spy
-
-
-# goal: calculate alpha
-    # remember the CAPM from our first session?
-    
 #  Alpha = Portfolio Return - (Risk-Free Rate) - beta * (Market Return - (Risk-Free Rate))
+    # we use the annualized returns of our strategy and of the spy
 
-portfolio_return =  np.exp(df['strategy vix']).cumprod()[-1] - 1
-market_return = np.exp(df['spy return'])[-1] - 1
-risk_free_rate = 0.03
-
-alpha_vix = portfolio_return - risk_free_rate - beta_vix *  (market_return - risk_free_rate)
+alpha_vix, beta_vix = alpha_beta(df["strategy vix"], df["spy return"], risk_free_rate, log=True)
 
 # name macro economic reason, that could explain this outperformance ?
     # is our assumption of a risk-free rate of 3% fair, given a timeframe of 23 years?
@@ -159,6 +164,53 @@ skewness = skew(df["simple return vix"])
 # how "pointy" the curve is, compared to normal distribution
 kurtosis = kurtosis(df["simple return vix"])
 
+# the same statistics from a streaming accumulator, which never needs the whole column at once
+    # e.g. for years of minute returns: feed it chunk by chunk, or let several workers fill one each and merge() them
+vix_moments = OnlineMoments(1, bins = np.arange(-10, 10, 0.25))
+for chunk in np.array_split(df[["simple return vix"]].to_numpy(), 10):
+    vix_moments.update(chunk)
+
+# vix_moments.skew[0], vix_moments.kurtosis[0] and the histogram counts are the same as above
+# plt.stairs(vix_moments.histogram[:, 0], vix_moments.bins)
 
 
+# Goal: one realized path says little about the risk of our strategy -> simulate 10 000 other paths it could have taken
+    # block bootstrap: the paths are made of random blocks of 21 consecutive days (about a month) of our returns
+        # this keeps the fat tails and the calm/volatile phases, method="normal" draws normally distributed returns instead
+    # n_jobs=None runs the simulation on all cores
+simulated_vix = simulate(df["strategy vix"], n_paths=10000, method="block", block_size=21, rfr=risk_free_rate, log=True, seed=42)
+
+# how bad can it get? 1%, 5%, 50% (median) and 95% quantile of every statistic over the simulated paths
+print(simulated_vix.quantile([0.01, 0.05, 0.5, 0.95]))
+
+plt.hist(simulated_vix["max_drawdown"] * 100, bins = 50)
+plt.xlabel("Max Drawdown in %")
+plt.ylabel("Frequency")
+plt.title("Max Drawdown of the Simulated Paths of Strategy Vix")
+plt.show()
 
+
+# Goal: measure the tail risk -> Value at Risk (VaR) and Expected Shortfall (ES)
+    # VaR 99%: the daily return that is only undercut on the 1% worst days, ES 99%: the average return on these 1% worst days
+    # historical: from our returns, gaussian: from a normal distribution, cornish_fisher: normal distribution corrected for skew and kurtosis
+
+# simple returns of all strategies and the spy (our columns are log returns)
+simple_returns = np.exp(df[["strategy spy", "strategy gs", "strategy vix", "spy return"]]) - 1
+
+tail_risk = pd.DataFrame({
+    (method, measure): values
+    for method in ["historical", "gaussian", "cornish_fisher"]
+    for measure, values in zip(["VaR 99%", "ES 99%"], var_es(simple_returns, level=0.99, method=method))
+})
+print(tail_risk * 100) # in %
+
+# the tail risk changes over time -> ES 99% over the last year (252 trading days) for every day
+rolling_var, rolling_es = rolling_var_es(simple_returns, window=252, level=0.99, method="historical")
+
+plt.plot(rolling_es["strategy vix"] * 100, label = "strategy vix")
+plt.plot(rolling_es["spy return"] * 100, label = "spy")
+plt.legend(loc=3)
+plt.ylabel("ES 99% in %")
+plt.title("Rolling 1-Year Expected Shortfall")
+plt.grid(True, alpha = .5)
+plt.show()
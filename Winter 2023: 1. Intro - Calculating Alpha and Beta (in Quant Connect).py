@@ -1,3 +1,6 @@
+from quant_tools.analytics import alpha_beta, annual_return
+from quant_tools.regression import rolling_regression
+
 # Initiate QuantBook, so we can get Data provided by QuantConnect
 qb = QuantBook()
 
@@ -31,38 +34,25 @@ df.head()
 df["Spy Returns"].describe()
 df["Tsla Returns"].describe()
 
-# get the covariance matrix for our entire dataframe
-# but we only need the COV between the Daily Returns and the VAR of Spy Returns
-cov_matrix = df.cov()
-df.cov()
-
-covariance = cov_matrix.iloc[2,3]
-print(f"covariance = {covariance}")
-
-variance = cov_matrix.iloc[2,2]
-print(f"variance = {variance}")
-
-# calculating beta by definition
-beta = covariance / variance
-print(f"beta = {beta}")
-
-# to calculate the alpha we'll need some additional data
+# beta = covariance between the daily returns of tesla and spy / variance of the spy returns
 # alpha = portfolio return - (risk-free rate + beta*(expected market return - risk-free rate)
+# both are calculated in quant_tools.analytics, which we also use for the other sessions
 
-# Portfolio Return
-preturn = (df["TSLA"][-1]/df["Tsla"][0])**(1/(3000/365.25))-1
+# Portfolio Return (annualized)
+preturn = annual_return(df["Tsla Returns"])
 print(f"preturn = {preturn}")
 
-# Market Return
-mreturn = (df["SPY"][-1]/df["spy"][0])**(1/(3000/365.25))-1
+# Market Return (annualized)
+mreturn = annual_return(df["Spy Returns"])
 print(f"mreturn = {mreturn}")
 
 # Risk-Free Rate
 rfr = 0.02 # more ore less average from last 10-years
 print(f"rfr = {rfr}")
 
-# Final-Step: Calculate the Alpha
-alpha = preturn-rfr-beta*(mreturn-rfr)
+# Final-Step: Calculate Alpha and Beta
+alpha, beta = alpha_beta(df["Tsla Returns"], df["Spy Returns"], rfr)
+print(f"beta = {beta}")
 print(f"alpha = {alpha}")
 
 import matplotlib.pyplot as plt
@@ -114,7 +104,11 @@ plt.title('Normalized Closing Prices Over Time')
 plt.legend()
 plt.show()
 
-rolling_correlation = df['Spy Returns'].rolling(window=90).corr(df['Tsla Returns'])
+# rolling beta, alpha, correlation and residual volatility over the last 90 days
+    # the rolling alpha is the arithmetic one (mean daily excess return * 252), not the compound one of alpha_beta above
+    # you can pass many stocks at once (one column each), e.g. rolling_regression(df[["Tsla Returns", ...]], ...)
+rolling = rolling_regression(df[["Tsla Returns"]], df["Spy Returns"], window=90, rfr=rfr)
+rolling_correlation = rolling["correlation"]["Tsla Returns"]
 plt.figure(figsize=(12,6))
 rolling_correlation.plot()
 plt.title('90-Day Rolling Correlation between SPY and TSLA Returns')
@@ -123,3 +117,12 @@ plt.ylabel('Correlation')
 plt.grid(True)
 plt.tight_layout()
 plt.show()
+
+# the beta isn't constant either
+rolling["beta"]["Tsla Returns"].plot(figsize=(12,6))
+plt.title('90-Day Rolling Beta of TSLA against SPY')
+plt.xlabel('Date')
+plt.ylabel('Beta')
+plt.grid(True)
+plt.tight_layout()
+plt.show()
@@ -7,6 +7,11 @@ from datetime import datetime
 from pypfopt import EfficientFrontier
 from pypfopt import risk_models
 from pypfopt import expected_returns
+from quant_tools.analytics import annual_volatility, max_drawdown
+from quant_tools.cache import PriceStore
+from quant_tools.covariance import ewma_cov, factor_model, ledoit_wolf
+from quant_tools.data import load_prices
+from quant_tools.portfolio import clean_weights, efficient_frontier, portfolio_returns, rebalance_max_sharpe
 
 # run the following command if you get an error with the libraries: pip install ortools==9.4.0
 
@@ -16,10 +21,10 @@ qb = QuantBook()
 # get data for the factors: Quality, Momentum, Value, Size, Small Cap and Emerging Markets
 equities = ["QUAL", "MTUM", "VLUE", "SIZE", "IJR", "IEMG"]
 
-for ticker in equities:
-    qb.AddEquity(ticker)
+# the prices are saved in a local price store => if you run the script again, only the days that are missing are downloaded
+price_store = PriceStore("price_store/daily")
 
-df = qb.History(qb.Securities.Keys, 2524, Resolution.Daily)["close"].unstack(level=0) # 2524 might seem weird but it maximizes our timeframe
+df = load_prices(equities, n_days=2524, qb=qb, store=price_store) # 2524 might seem weird but it maximizes our timeframe
 
 # df or print(df) <- to see the dataframe in research.ipynb
 
@@ -28,6 +33,19 @@ df = qb.History(qb.Securities.Keys, 2524, Resolution.Daily)["close"].unstack(lev
 returns = expected_returns.mean_historical_return(df)
 covariance = risk_models.sample_cov(df)
 
+# with many more assets (e.g. 1000 stocks) the sample covariance gets noisy and ill-conditioned, other estimators:
+    # "ledoit_wolf": sample covariance shrunk towards a constant variance
+    # "ewma": exponentially weighted, recent days count more
+    # "factor": regression on the factor ETFs QUAL, MTUM, VLUE and SIZE (loadings + factor covariance + residual variances)
+covariance_model = "sample"
+if covariance_model == "ledoit_wolf":
+    covariance = ledoit_wolf(df)
+elif covariance_model == "ewma":
+    covariance = ewma_cov(df, span=180)
+elif covariance_model == "factor":
+    # EfficientFrontier needs the full matrix, the optimizers of quant_tools.portfolio also take the factor form directly
+    covariance = factor_model(df, df[["QUAL", "MTUM", "VLUE", "SIZE"]]).to_dense()
+
 # initiate Efficient Frontier, with weight bounds so that we don't leave out any factors or have one with our entire portfolio in it
 # it will return to us the optimal weighting of our portfolio
 ef = EfficientFrontier(returns, covariance, weight_bounds=(0.05, 0.50))
@@ -37,21 +55,35 @@ cleaned_weightings = ef.clean_weights()
 # print(raw_weights)
 # print(cleaned_weights)
 
+# the risk free rate and the bounds above are just one choice => solve a whole grid of portfolios with the same returns/covariance
+    # max sharpe, min volatility and portfolios with a target return, for every risk free rate and every pair of bounds
+    # the grid is small, so one process is enough (n_jobs=None uses all cores for bigger grids)
+frontier = efficient_frontier(returns, covariance, risk_free_rates=[0.0, 0.02, 0.04], weight_bounds=[(0, 1), (0.05, 0.50)], n_jobs=1)
+# print(frontier[frontier["objective"] == "max_sharpe"])
+
+# rolling rebalancing: re-optimize at the end of every month with only the data up to that month (same bounds)
+    # None uses all the data so far, a number of days (e.g. 756 = 3 years) uses a rolling window
+rebalance_window = None
+monthly_weightings = clean_weights(rebalance_max_sharpe(df, window=rebalance_window, freq="M", risk_free_rate=0.02, weight_bounds=(0.05, 0.50)))
+
 
 # pct change to calculate return
 df = df.pct_change()
 df.fillna(0, inplace=True)
 
 # add a new column with the return of our portfolio
-df["portfolio simple return"] = sum(df[symbol] * cleaned_weightings[symbol] for symbol in cleaned_weightings.keys())
+df["portfolio simple return"] = portfolio_returns(df, cleaned_weightings)
+
+# return of the monthly rebalanced portfolio, the weights of a month end are used from the next day on
+    # drift=True lets the weights move with the prices during the month instead of resetting them every day
+df["rebalanced simple return"] = portfolio_returns(df, monthly_weightings, drift=False)
 
 # Add Spy for comparison
-SPY = qb.AddEquity("SPY").Symbol
-df["Spy"]= qb.History(SPY, 2524, Resolution.Daily)["close"].unstack(level=0).pct_change().fillna(0)
+df["Spy"]= load_prices(["SPY"], n_days=2524, qb=qb, store=price_store)["SPY"].pct_change().fillna(0)
 df
 
 # Cumulative Return Plot
-cumulative_returns = (df[['portfolio simple return']] + 1).cumprod()
+cumulative_returns = (df[['portfolio simple return', 'rebalanced simple return']] + 1).cumprod()
 spy_returns = (df["Spy"] + 1).cumprod()
 
 fig, ax = plt.subplots(figsize=(12, 6))
@@ -70,14 +102,13 @@ plt.tight_layout()
 # Show the plot
 plt.show()
 
-# a. Volatility
-portfolio_volatility = df["portfolio simple return"].std()
+# a. Volatility (annualized)
+portfolio_volatility = annual_volatility(df["portfolio simple return"])
 print(f"Portfolio Volatility: {portfolio_volatility:.4f}")
 
-# b. Maximum Drawdown
-cumulative_return = (df["portfolio simple return"] + 1).cumprod()
-max_drawdown = ((cumulative_return.cummax() - cumulative_return) / cumulative_return.cummax()).max()
-print(f"Maximum Drawdown: {max_drawdown:.4f}")
+# b. Maximum Drawdown (the largest loss from a previous high, as a negative number)
+portfolio_max_drawdown = max_drawdown(df["portfolio simple return"])
+print(f"Maximum Drawdown: {portfolio_max_drawdown:.4f}")
 
 # 4. Correlation Matrix
 correlation_matrix = df.corr()
@@ -3,184 +3,113 @@ import matplotlib.pyplot as plt
 from datetime import datetime
 import pandas as pd
 from tabulate import tabulate
+from quant_tools.cache import PriceStore
+from quant_tools.analytics import strategy_stats
+from quant_tools.data import load_prices
+from quant_tools.mean_reversion import run_mean_reversion
+from quant_tools.plotting import downsample
 
 qb = QuantBook()
 
 # define a function that 
   # simulates a SMA Mean Reversion strategy for given tickers,
   # a specific duration of the SMA,
-  # a threshold on when to buy/sell,
-  # a "safety net" when to exit given an unpredictable market,
+  # one or more sets of bands: a threshold on when to buy/sell and a "safety net" when to exit given an unpredictable market (or None),
   # and the total number of days that we want to have simulated
 
-def SMAMeanReversionSafety(tickers, n_sma, threshold, safety_threshold, n_days):
-    results = {}  # create a dictionary to store the results for each ticker
+# the data is only downloaded once and the SMA/STD are only calculated once for all band sets (see quant_tools.mean_reversion)
+# => running the strategy with and without safety net costs about the same as running one of them
 
-    # loop that goes through each ticker that is the list of tickers
-    for ticker in tickers:
-        
-        # add our ticker to the equities
-        symbol = qb.AddEquity(ticker).Symbol
-
-        # get the data for our ticker
-        df = qb.History(symbol, n_days, Resolution.Daily)["close"].unstack(level=0)
-
-        # calculate the SMA
-        df["SMA"] = df[symbol].rolling(n_sma).mean()
+def SMAMeanReversionVariants(tickers, n_sma, band_sets, n_days, store=None):
+    results = [{} for _ in band_sets]  # one dictionary per band set to store the results for each ticker
 
-        # calculate the STD in the same timeframe
-        df["STD"] = df[symbol].rolling(n_sma).std()
+    # get the data for all of our tickers in one request (or from our local price store, if we already have it)
+    prices = load_prices(tickers, n_days=n_days, qb=qb, store=store)
 
-        # define the upper and lower bounds depending on our threshold
-        df["Upper"] = df["SMA"] + threshold * df["STD"]
-        df["Safety_Upper"] = df["SMA"] + safety_threshold * df["STD"]
-      
-        df["Lower"] = df["SMA"] - threshold * df["STD"]
-        df["Safety_Lower"] = df["SMA"] - safety_threshold * df["STD"]
+    # simulate every band set for every ticker at once
+    engine = run_mean_reversion(prices.to_numpy(), n_sma, band_sets)
 
-        # make a column to signal if we'll go long (1), short (-1) or stay neutral (0)
-        df["Signal"] = np.where((df[symbol]>df["Upper"]) & (df[symbol]<df["Safety_Upper"]), -1, 0)
-        df["Signal"] = np.where((df[symbol]<df["Lower"]) & (df[symbol] > df["Safety_Lower"]), 1, df["Signal"])
+    for j, ticker in enumerate(prices.columns):
 
-        # drop first (n_sma) number of days, because of NaN values
-        # get all the values after the first n_sma days
+        # drop first (n_sma) number of days (after the ticker was listed), because of NaN values
         # this is useful otherwise the first entry for the BAH Return column wouldn't be 1 (might be higher or lower) => screws our return metrics
-        df = df.iloc[n_sma:]
-
-        # calculate the log return of each day
-        df["Log_Returns"] = np.log(df[symbol]/df[symbol].shift(1)).fillna(0)
-
-        # calculate our strategies returns
-        # days X return is dependent on the equities return that day and the direction we chose the day before => we have to take the signal from the day before
-        df["Strategy_Returns"] = df["Log_Returns"] * df["Signal"].shift(1).fillna(0)
-        df["Strategy_Cumulative_Returns"] = np.exp(df['Strategy_Returns'].cumsum()).fillna(0)
-
-        # get high and low for our strategy
-        df["Strategy_High"] = df["Strategy_Cumulative_Returns"].cummax()
-        df["Strategy_Low"] = df["Strategy_Cumulative_Returns"].cummin()
-
-        # we want to compare to buy and hold => calcualte every metric again
-
-        # return + high and low
-        df["BAH_Cumulative_Returns"] = np.exp(df['Log_Returns'].cumsum()).fillna(0)
-        df["BAH_High"] = df['BAH_Cumulative_Returns'].cummax()
-        df["BAH_Low"] = df['BAH_Cumulative_Returns'].cummin()
-
-        results[ticker] = df
+        rows = slice(engine["start"][j], None)
+        index = prices.index[rows]
+
+        # buy and hold is the same for every band set
+        bah_cumulative = engine["bah_cumulative"][rows, j]
+
+        for k, result in enumerate(results):
+            strategy_cumulative = engine["strategy_cumulative"][k, rows, j]
+
+            result[ticker] = pd.DataFrame({
+                ticker: prices[ticker].to_numpy()[rows],
+                "SMA": engine["sma"][rows, j],
+                "STD": engine["std"][rows, j],
+                "Signal": engine["signals"][k, rows, j],
+                "Log_Returns": engine["log_returns"][rows, j],
+                "Strategy_Returns": engine["strategy_returns"][k, rows, j],
+                "Strategy_Cumulative_Returns": strategy_cumulative,
+                "Strategy_High": np.maximum.accumulate(strategy_cumulative),
+                "Strategy_Low": np.minimum.accumulate(strategy_cumulative),
+                "BAH_Cumulative_Returns": bah_cumulative,
+                "BAH_High": np.maximum.accumulate(bah_cumulative),
+                "BAH_Low": np.minimum.accumulate(bah_cumulative),
+            }, index=index)
 
     return results
 
-def SMAMeanReversion(tickers, n_sma, threshold, n_days):
-    results = {}  # dictionary to store results for each ticker
-
-    for ticker in tickers:
-        # add our ticker to the equities
-        symbol = qb.AddEquity(ticker).Symbol
-
-        # get the data for our ticker
-        df = qb.History(symbol, n_days, Resolution.Daily)["close"].unstack(level=0)
-
-        # calculate the SMA
-        df["SMA"] = df[symbol].rolling(n_sma).mean()
-
-        # calculate the STD in the same timeframe
-        df["STD"] = df[symbol].rolling(n_sma).std()
-
-        # define the upper and lower bounds depending on our threshold
-        df["Upper"] = df["SMA"] + threshold * df["STD"]
-        df["Lower"] = df["SMA"] - threshold * df["STD"]
-
-        # make a column to signal if we'll go long (1), short (-1) or stay neutral (0)
-        df["Signal"] = np.where((df[symbol]>df["Upper"]), -1, 0)
-        df["Signal"] = np.where((df[symbol]<df["Lower"]), 1, df["Signal"])
-
-        # drop first (n_sma) number of days, bc NaN values
-        # get all the values after the first n_sma days
-        # This is useful otherwise the first entry for the BAH Return column wouldn't be 1 (might be higher or lower) => which screws our return metrics
-        df = df.iloc[n_sma:]
-
-        # calculate the log return of each day
-        df["Log_Returns"] = np.log(df[symbol]/df[symbol].shift(1)).fillna(0)
-
-        # calculate our strategies returns
-        # days X return is dependent on the equities return that day and the direction we chose the day before => we have to take the signal from the day before
-        df["Strategy_Returns"] = df["Log_Returns"] * df["Signal"].shift(1).fillna(0)
-        df["Strategy_Cumulative_Returns"] = np.exp(df['Strategy_Returns'].cumsum()).fillna(0)
+def SMAMeanReversionSafety(tickers, n_sma, threshold, safety_threshold, n_days, store=None):
+    # we go long (1) if the price is between the lower band and the lower "safety net", short (-1) between the upper band and the upper "safety net"
+    return SMAMeanReversionVariants(tickers, n_sma, [(threshold, safety_threshold)], n_days, store)[0]
 
-        # get high and low for our strategy
-        df["Strategy_High"] = df["Strategy_Cumulative_Returns"].cummax()
-        df["Strategy_Low"] = df["Strategy_Cumulative_Returns"].cummin()
-
-        # We want to compare to buy and hold => calculate every metric again
-
-        # return + high and low
-        df["BAH_Cumulative_Returns"] = np.exp(df['Log_Returns'].cumsum()).fillna(0)
-        df["BAH_High"] = df['BAH_Cumulative_Returns'].cummax()
-        df["BAH_Low"] = df['BAH_Cumulative_Returns'].cummin()
-
-        results[ticker] = df
-
-    return results
+def SMAMeanReversion(tickers, n_sma, threshold, n_days, store=None):
+    # we go long (1) below the lower band and short (-1) above the upper band
+    return SMAMeanReversionVariants(tickers, n_sma, [(threshold, None)], n_days, store)[0]
 
 
 # define a function that uses our data generated from the trading strategies, to calculate various risk metrics
 def getStrategyStats(data, rfr):
     stats_dict = {} # create a dictionary to store each strategies stats in
 
-    # will iterate over every ticker and dataframe "pair" that we've stored in the data
-    for ticker, df in data.items():
-      
-        # create dictionaries for our strategy as well as buy and hold
-        Trading_Strat, BAH_Strat = {}, {}
-
-        # total returns
-        Trading_Strat["Total_Returns"] = df["Strategy_Cumulative_Returns"][-1] - 1
-        BAH_Strat["Total_Returns"] = df["BAH_Cumulative_Returns"][-1] - 1
-
-        # compound annual growth rate
-        Trading_Strat["Annual_Returns"] = (Trading_Strat['Total_Returns'] + 1) ** (1 / (len(df) / 252)) - 1
-        BAH_Strat["Annual_Returns"] = (BAH_Strat['Total_Returns'] + 1) ** (1 / (len(df) / 252)) - 1
-
-        # annual volatility
-        Trading_Strat["Annual_Volatility"] = df["Strategy_Returns"].std() * np.sqrt(252)
-        BAH_Strat["Annual_Volatility"] = df["Log_Returns"].std() * np.sqrt(252)
-
-        # sharpe ratio
-        Trading_Strat["Sharpe_Ratio"] = (Trading_Strat['Annual_Returns'] - rfr) / Trading_Strat['Annual_Volatility']
-        BAH_Strat["Sharpe_Ratio"] = (BAH_Strat['Annual_Returns'] - rfr) / BAH_Strat['Annual_Volatility']
+    # put the returns of our strategy and of buy and hold for every ticker into one matrix (NaN where a ticker has no data)
+    # => all metrics for all tickers are calculated at once (see quant_tools.analytics)
+    returns = pd.concat({(ticker, stats): df[column] for ticker, df in data.items()
+                         for stats, column in (("Trading_Stats", "Strategy_Returns"), ("BAH_Stats", "Log_Returns"))}, axis=1)
 
-        # sortino ratio
-        df_negative = df[df["Strategy_Returns"]<0]
-        negative_std = df_negative["Strategy_Returns"].std() * np.sqrt(252)
-        Trading_Strat["Sortiono_Ratio"] = (Trading_Strat["Annual_Returns"]-rfr)/negative_std
+    # total returns, compound annual growth rate, annual volatility, sharpe ratio, sortino ratio and max drawdown
+    stats = strategy_stats(returns, rfr)
 
-        df_negative = df[df["Log_Returns"]<0]
-        negative_std = df_negative["Log_Returns"].std() * np.sqrt(252)
-        BAH_Strat["Sortiono_Ratio"] = (BAH_Strat["Annual_Returns"]-rfr)/negative_std
-
-        # max drawdown
-        trading_dd = (df["Strategy_Cumulative_Returns"] - df["Strategy_High"]) / df["Strategy_High"]
-        bah_dd = (df["BAH_Cumulative_Returns"] - df["BAH_High"]) / df["BAH_High"]
-
-        Trading_Strat["Max Draw Down"] = trading_dd.min()
-        BAH_Strat["Max Draw Down"] = bah_dd.min()
-
-        stats_dict[ticker] = {"Trading_Stats": Trading_Strat, "BAH_Stats": BAH_Strat}
+    for ticker in data.keys():
+        stats_dict[ticker] = {"Trading_Stats": stats[(ticker, "Trading_Stats")].to_dict(), "BAH_Stats": stats[(ticker, "BAH_Stats")].to_dict()}
 
     return stats_dict
     
-def plotData(plot_tickers):
-    
+def plotData(plot_tickers, renderer=None):
+    # every line is downsampled to a few thousand points before it's drawn (see quant_tools.plotting),
+    # with a renderer the charts are saved as files in the background instead of being shown one by one
+
     for ticker in plot_tickers:
+        lines = {
+            f'{ticker} - Mean Reversion Strategy with Safety': data_safety[ticker]['Strategy_Cumulative_Returns'],
+            f'{ticker} - Mean Reversion Strategy': data[ticker]['Strategy_Cumulative_Returns'],
+            f'{ticker} - Buy and Hold': data_safety[ticker]['BAH_Cumulative_Returns'],
+        }
+        title = 'Cumulative Returns for Mean Reversion and Buy and Hold Strategies'
+
+        if renderer is not None:
+            renderer.plot(f"mean_reversion_{ticker}", lines, title=title, xlabel='Date', ylabel='Returns (%)')
+            continue
+
         fig, ax = plt.subplots(figsize=(12, 5))
         
-        ax.plot(data_safety[ticker]['Strategy_Cumulative_Returns'], label=f'{ticker} - Mean Reversion Strategy with Safety')
-        ax.plot(data[ticker]['Strategy_Cumulative_Returns'], label=f'{ticker} - Mean Reversion Strategy')
-        ax.plot(data_safety[ticker]['BAH_Cumulative_Returns'], label=f'{ticker} - Buy and Hold')
+        for label, line in lines.items():
+            line = downsample(line)
+            ax.plot(line, label=label)
         
         ax.set_xlabel('Date')
         ax.set_ylabel('Returns (%)')
-        ax.set_title('Cumulative Returns for Mean Reversion and Buy and Hold Strategies')
+        ax.set_title(title)
         
         ax.legend()
         plt.show()
@@ -209,9 +138,10 @@ safety_threshold = 3 # losses during rare events/ downward moves (e.g. Covid-Cra
 
 n_days = 500 # can be chosen upon desire, but less data points are better to visualize
 rfr = 0.02
+price_store = PriceStore("price_store/daily") # local copy of the downloaded prices, re-runs only download what's missing
 
-data = SMAMeanReversion(tickers, n_sma, threshold, n_days)
-data_safety = SMAMeanReversionSafety(tickers, n_sma, threshold, safety_threshold, n_days)
+# plain strategy and strategy with safety net from one shared pass
+data, data_safety = SMAMeanReversionVariants(tickers, n_sma, [(threshold, None), (threshold, safety_threshold)], n_days, price_store)
 
 stats_dict = getStrategyStats(data, rfr)
 safe_stats_dict = getStrategyStats(data_safety, rfr)
@@ -219,5 +149,27 @@ safe_stats_dict = getStrategyStats(data_safety, rfr)
 displayPerformance(tickers)
 plotData(tickers)
 
+# with many tickers (or minute data) save the charts as files in the background instead:
+# from quant_tools.plotting import ChartRenderer
+# with ChartRenderer("charts/mean_reversion") as renderer:
+#     plotData(tickers, renderer)
+
 # unfortunately, due to data limitations, QuantConnect doenst allow enough cells to output
 # if you want to see the data for every file use: displayPerformance(["TICKER"])
+
+# if you want to find good values for n_sma, threshold and safety_threshold, don't edit the values above and re-run everything
+# use the grid search instead, it simulates every combination from the same data (and on all of your cores):
+# from quant_tools.mean_reversion import sweep_mean_reversion
+# prices = load_prices(tickers, n_days=n_days, qb=qb, store=price_store)
+# sweep = sweep_mean_reversion(prices, n_sma_values=range(10, 61, 5), thresholds=[0.5, 1, 1.5, 2], safety_thresholds=[None, 2, 3, 4], rfr=rfr)
+# sweep.sort_values("Sharpe_Ratio", ascending=False).head(20)
+
+# minute bars: years of them for hundreds of tickers don't fit into memory => out-of-core mode (see quant_tools.mean_reversion)
+# the bars are read from a local price store chunk by chunk, the rolling window and the running sums are carried over
+# from one chunk to the next and the results of every chunk are written to Parquet files right away
+# fill the store once, e.g. one year at a time: load_prices(tickers, start, end, qb=qb, resolution=Resolution.Minute, store=minute_store)
+# from quant_tools.mean_reversion import run_mean_reversion_chunked
+# minute_store = PriceStore("price_store/minute")
+# minute_stats, minute_bah_stats = run_mean_reversion_chunked(minute_store, tickers, n_sma, [(threshold, None), (threshold, safety_threshold)],
+#                                                             "results/mean_reversion_minute", rfr=rfr, periods_per_year=252 * 390)
+# pd.read_parquet("results/mean_reversion_minute/band_set_1/SNAP", columns=["Strategy_Cumulative_Returns"])  # one ticker, one column
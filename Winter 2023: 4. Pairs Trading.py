@@ -1,10 +1,13 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from itertools import combinations
 import matplotlib.pyplot as plt
-import statsmodels.api as sm
-from statsmodels.tsa.stattools import coint
+from quant_tools import analytics
+from quant_tools.cache import PriceStore
+from quant_tools.cointegration import screen_pairs
+from quant_tools.data import load_prices
+from quant_tools.online import OnlineZScore
+from quant_tools.plotting import downsample
 
 qb = QuantBook()
 
@@ -13,7 +16,7 @@ qb = QuantBook()
         # (2) the (log) price of the stocks -> to check for cointegration
                 # the linearization helps to detect cointegration
 
-def getStockInfo(tickers, start, end):
+def getStockInfo(tickers, start, end, source=None, store=None):
     """
     Fetch daily closing prices for the specified tickers over the given date range.
 
@@ -21,35 +24,16 @@ def getStockInfo(tickers, start, end):
     - tickers (list): List of stock tickers.
     - start (datetime): Start date for the data retrieval.
     - end (datetime): End date for the data retrieval.
+    - source (str): Directory with local <TICKER>.csv/.parquet files, None downloads the data from QuantConnect.
+    - store (PriceStore): Local price store, only the days that aren't stored yet are downloaded.
 
     Returns:
     - stock_returns (DataFrame): Daily returns for each stock.
     - stock_prices (DataFrame): Logarithmic prices for each stock.
     """
-    # DataFrame to store the fetched data
-    results = pd.DataFrame()
-
-    # Loop through each ticker to retrieve data
-    for ticker in tickers:
-        try:
-            # Add the ticker to QuantBook for data access
-            symbol = qb.AddEquity(ticker).Symbol
-
-            # Fetch daily closing prices for the ticker
-            df = qb.History(symbol, start, end, Resolution.Daily)["close"].unstack(level=0)
-
-            # gives us an error message, if there are no values in the dataframe ( => we weren't able to download any data)
-            if df.empty:
-                print(f"No data available for {ticker} in the specified date range.")
-                continue
-
-            # stores the dataframe of each ticker, which consists of one column, as a column in our results dataframe  
-            results[ticker] = df
-
-        # print an error message if a key error occurs ( => we have used a ticker that doesn't exists, or has a typo in it)
-        except KeyError:
-            print(f"Data for {ticker} not found.")
-            continue
+    # fetch the daily closing prices of all tickers in one request, aligned on one date index
+    # tickers without data (e.g. typos) are reported and left out
+    results = load_prices(tickers, start, end, qb=qb, source=source, store=store)
 
     # Warning for missing values
     if results.isnull().values.any():
@@ -61,13 +45,20 @@ def getStockInfo(tickers, start, end):
 
     return stock_returns, stock_prices
 
-def cointegration(data, tickers):
+def cointegration(data, tickers, min_correlation=None, max_pairs=None, n_jobs=1, cache_path=None):
     """
     Check for cointegration between pairs of tickers.
 
+    For large universes the tests can be pre-filtered, run on several cores and cached on disk
+    (see quant_tools.cointegration.screen_pairs), with the defaults every pair is tested in this process.
+
     Parameters:
     - data (DataFrame): Stock price data.
     - tickers (list): List of tickers.
+    - min_correlation (float): Only test pairs whose prices are at least this correlated.
+    - max_pairs (int): Only test this many pairs with the smallest distance between their prices.
+    - n_jobs (int): Number of processes the tests are spread over (None = all cores).
+    - cache_path (str): File to cache the p-values in, so re-runs only test new pairs.
 
     Returns:
     - results_cointegration (dict): Pairs that are cointegrated.
@@ -76,12 +67,11 @@ def cointegration(data, tickers):
     # create dictionary to store cointegrated pairs 
     results_cointegration = {}
 
-    # makes a list containing all (distinct) pairs that can be formed with our tickers
-    possible_pairs = list(combinations(tickers, 2))
+    # forms all (distinct) pairs that can be made with our tickers and tests each of them for cointegration
+    p_values = screen_pairs(data, tickers, min_correlation=min_correlation, max_pairs=max_pairs, n_jobs=n_jobs, cache_path=cache_path)
 
-    # goes trough each possible pair, tests it for cointegration and if it's significant (p-value <= 0.05), we add it to our results
-    for pair in possible_pairs:
-        _, p_value, _ = coint(data[pair[0]], data[pair[1]])
+    # if it's significant (p-value <= 0.05), we add it to our results
+    for pair, p_value in p_values.items():
         
         # A p-value below 0.05 suggests cointegration
         if p_value <= 0.05:
@@ -90,103 +80,185 @@ def cointegration(data, tickers):
     print(results_cointegration)
     return results_cointegration
 
-def spread(ticker_pairs):
+def _pair_columns(stock_prices, pairs):
+    # (days x pairs) matrices with the prices of y (first element of each pair) and x (second element)
+    position = {ticker: i for i, ticker in enumerate(stock_prices.columns)}
+    prices = stock_prices.to_numpy(dtype=np.float64)
+
+    y = prices[:, [position[pair[0]] for pair in pairs]]
+    x = prices[:, [position[pair[1]] for pair in pairs]]
+
+    return y, x
+
+def _moving_sum(values, window):
+    # sum over the last (window) days for every column, NaN as long as the window isn't full
+    cumsum = np.cumsum(values, axis=0)
+    result = np.full(cumsum.shape, np.nan)
+
+    if len(values) >= window:
+        result[window-1] = cumsum[window-1]
+        result[window:] = cumsum[window:] - cumsum[:-window]
+
+    return result
+
+def hedge_ratios(stock_prices, pairs, window=None):
+    """
+    Estimate the OLS regression y = intercept + hedge ratio * x for all pairs at once.
+
+    Instead of one statsmodels fit per pair we use the closed form solution
+    (hedge ratio = cov(x, y) / var(x), intercept = mean(y) - hedge ratio * mean(x)) on the whole price matrix.
+
+    Parameters:
+    - stock_prices (DataFrame): Logarithmic prices for each stock.
+    - pairs (list): Stock pairs (y, x).
+    - window (int): Number of days for a rolling estimate, None uses the whole sample.
+
+    Returns:
+    - hedge_ratio (ndarray): Hedge ratio for each pair, shape (pairs,) or (days x pairs) if window is set.
+    - intercept (ndarray): Intercept for each pair, same shape as hedge_ratio.
+    """
+    y, x = _pair_columns(stock_prices, pairs)
+
+    # center the prices, this keeps the sums (and the differences of the cumulative sums) numerically precise
+    x_center = x.mean(axis=0)
+    y_center = y.mean(axis=0)
+    x = x - x_center
+    y = y - y_center
+
+    if window is None:
+        hedge_ratio = (x * y).sum(axis=0) / (x * x).sum(axis=0)
+        intercept = y_center - hedge_ratio * x_center
+        return hedge_ratio, intercept
+
+    # rolling estimate: the moments of every window come from cumulative sums => O(days x pairs) regardless of the window
+    sum_x = _moving_sum(x, window)
+    sum_y = _moving_sum(y, window)
+    sum_xx = _moving_sum(x * x, window)
+    sum_xy = _moving_sum(x * y, window)
+
+    hedge_ratio = (sum_xy - sum_x * sum_y / window) / (sum_xx - sum_x * sum_x / window)
+    intercept = (sum_y / window + y_center) - hedge_ratio * (sum_x / window + x_center)
+
+    return hedge_ratio, intercept
+
+def spread(ticker_pairs, stock_prices, window=None):
     """
     Calculate the spread between cointegrated stock pairs.
 
     Parameters:
     - ticker_pairs (dict): Cointegrated stock pairs.
+    - stock_prices (DataFrame): Logarithmic prices for each stock.
+    - window (int): Number of days for a rolling (time-varying) hedge ratio, None uses one hedge ratio for the whole sample.
 
     Returns:
     - spread (DataFrame): Spread values for each pair.
     """
-    spread = pd.DataFrame()
+    pairs = list(ticker_pairs)
 
-    for key in results_cointegration.keys():
-        
-        # assign stocks to x and y
-        x = stock_prices[key[1]]
-        y = stock_prices[key[0]]
+    # assign stocks to x and y and estimate the hedge ratio of every pair in one go
+    y, x = _pair_columns(stock_prices, pairs)
+    hedge_ratio, _ = hedge_ratios(stock_prices, pairs, window)
 
-        # Use Ordinary Least Squares (OLS) for regression
-        x = sm.add_constant(x)
-        model = sm.OLS(y, x).fit()
+    # Calculate spread (spread = actual y - slope of linear regression * actual x) (=> spread represents the difference between what's the actual y and predicted y) 
+    # all spreads are written into one preallocated (days x pairs) array
+    spreads = np.multiply(hedge_ratio, x)
+    np.subtract(y, spreads, out=spreads)
 
-        # Calculate spread (spread = actual y - slope of linear regression * actual x) (=> spread represents the difference between what's the actual y and predicted y) 
-        spread[key] = y - model.params[key[1]] * x[key[1]]
-        
-        # uncomment to visualize each pairs spread
-        #spread[key].plot(figsize=(12,6))
-        #plt.axhline(spread[key].mean(), color='black')
-        #plt.legend(['Spread between ' + key[0] + " and " + key[1]])
-        #plt.show()
+    spread = pd.DataFrame(spreads, index=stock_prices.index, columns=pd.Index(pairs, tupleize_cols=False))
 
+    # uncomment to visualize each pairs spread
+    #for key in spread.columns:
+    #    spread[key].plot(figsize=(12,6))
+    #    plt.axhline(spread[key].mean(), color='black')
+    #    plt.legend(['Spread between ' + key[0] + " and " + key[1]])
+    #    plt.show()
 
     return spread
 
-def z_score(spread_pairs):
+def z_score(spread_pairs, mode="full", halflife=None):
     """
     Calculate the z-score for spread of stock pairs.
 
     Parameters:
     - spread_pairs (DataFrame): Spread values for stock pairs.
+    - mode (str): "full" uses mean and std of the whole sample (look-ahead!),
+                  "online" uses only the data up to each day (see quant_tools.online.OnlineZScore).
+    - halflife (float): Halflife in days for exponentially weighted moments in "online" mode, None for expanding moments.
 
     Returns:
     - z_scores (DataFrame): Z-scores for each pair.
     """
-    z_scores = pd.DataFrame()
-
-    for pair in spread_pairs.columns:
-        # Calculate z-score
-            # z_score = (acutal value - expected value) / standard deviation
-        z_scores[pair] = (spread_pairs[pair] - spread_pairs[pair].mean()) / spread_pairs[pair].std()
-
-        # uncomment to visualize z_scores
-        #z_scores[pair].plot(figsize=(12,6))
-        #plt.axhline(z_scores[pair].mean())
-        #plt.axhline(1.0, color='red')
-        #plt.axhline(-1.0, color='green')
-        #plt.show()
+    # Calculate z-score
+        # z_score = (acutal value - expected value) / standard deviation
+    if mode == "full":
+        z_scores = (spread_pairs - spread_pairs.mean()) / spread_pairs.std()
+    elif mode == "online":
+        # the same object can be kept and fed with one new row of spreads per day when trading live
+        z_engine = OnlineZScore(len(spread_pairs.columns), halflife=halflife)
+        z_scores = pd.DataFrame(z_engine.transform(spread_pairs.to_numpy()), index=spread_pairs.index, columns=spread_pairs.columns)
+    else:
+        raise ValueError(f"Unknown z-score mode: {mode}")
+
+    # uncomment to visualize z_scores
+    #for pair in z_scores.columns:
+    #    z_scores[pair].plot(figsize=(12,6))
+    #    plt.axhline(z_scores[pair].mean())
+    #    plt.axhline(1.0, color='red')
+    #    plt.axhline(-1.0, color='green')
+    #    plt.show()
 
     return z_scores
 
-def trade(stock_prices, spreads, z_scores, std_open, std_out, stock_returns):
+def trade(stock_prices, spreads, z_scores, std_open, std_out, stock_returns, hold=False):
     """
     Determine trading signals based on z-scores.
 
+    All pairs are evaluated at once: the z-scores and the returns of both legs are turned into
+    (days x pairs) numpy arrays, so we don't have to walk through every single day in python.
+
     Parameters:
     - stock_prices (DataFrame): Logarithmic prices for each stock.
     - spreads (DataFrame): Spread values for each pair.
     - z_scores (DataFrame): Z-scores for each pair.
-    - std_open (float): Z-score threshold for trading signals.
-    - std_out (float): Not currently used.
+    - std_open (float): Z-score threshold for opening positions.
+    - std_out (float): Z-score threshold for closing positions (only used if hold is True).
     - stock_returns (DataFrame): Daily returns for each stock.
+    - hold (bool): If True, an opened position is held until the z-score falls back below std_out,
+                   otherwise the position is re-evaluated every day (|z-score| > std_open or flat).
 
     Returns:
     - strategy_returns (DataFrame): Strategy returns based on trading signals.
     """
-    strategy_returns = pd.DataFrame(index=stock_prices.index)
+    pairs = list(spreads.columns)
+
+    # (days x pairs) matrices: z-scores, returns of y (first element of the pair) and x (second element)
+    z = z_scores[spreads.columns].to_numpy(dtype=np.float64)
+    y_returns = stock_returns[[pair[0] for pair in pairs]].to_numpy(dtype=np.float64)
+    x_returns = stock_returns[[pair[1] for pair in pairs]].to_numpy(dtype=np.float64)
 
-    for pair in spreads.columns:
-        returns_for_pair = []
+    # our spread is y minus x, where y is the first element of the pair and x is the second element
+    # if the z_score of our spread is to low => y is to low, compared to x => short x, go long y (1)
+    # vice versa if the z_score is to high (-1)
+    signal = np.where(z < -std_open, 1, np.where(z > std_open, -1, 0)).astype(np.int8)
 
-        # Determine buy/sell/hold signals based on z-scores
-        for i in range(len(stock_prices)-1):
+    if hold:
+        # a new signal opens (or flips) the position, a z-score inside of +-std_out closes it
+        # on all other days we keep yesterday's position => NaN, which we forward fill below
+        state = np.where(signal != 0, signal, np.where(np.abs(z) < std_out, 0, np.nan))
 
-        # our spread is y minus x, where y is the first element of the pair and x is the second element
-        # if the z_score of our spread is to low => y is to low, compared to x => short x, go long y
-        # vice versa if the z_score is to high
-            if z_scores[pair][i] < -std_open:
-                returns_for_pair.append(- stock_returns[pair[1]][i+1] + stock_returns[pair[0]][i+1])
-            elif z_scores[pair][i] > std_open:
-                returns_for_pair.append(+ stock_returns[pair[1]][i+1] - stock_returns[pair[0]][i+1])
-            else:
-                returns_for_pair.append(0)
+        # forward fill along the days: for every cell take the row of the last day that had a decision
+        rows = np.arange(len(state))[:, None]
+        last_decision = np.maximum.accumulate(np.where(np.isnan(state), 0, rows), axis=0)
+        state = np.take_along_axis(state, last_decision, axis=0)
 
-        returns_for_pair.append(0)
-        strategy_returns[pair] = returns_for_pair
+        # days before the first decision are flat
+        signal = np.nan_to_num(state, nan=0).astype(np.int8)
 
-    return strategy_returns
+    # the signal of day i earns the spread return of day i+1, the last day earns nothing
+    strategy_returns = np.zeros(z.shape, dtype=np.float64)
+    strategy_returns[:-1] = np.where(signal[:-1] == 0, 0.0, signal[:-1] * (y_returns[1:] - x_returns[1:]))
+
+    return pd.DataFrame(strategy_returns, index=stock_prices.index, columns=spreads.columns)
 
 def cumulative_returns(returns):
     """
@@ -198,77 +270,77 @@ def cumulative_returns(returns):
     Returns:
     - cumulative_return (dict): Cumulative returns for each stock pair.
     """
-    cumulative_return = {}
-    pair_returns = pd.DataFrame()
-
-    for pair in returns.columns:
-        # Calculate cumulative returns
-        pair_returns[pair] = (1 + returns[pair]).cumprod() -1
-        cumulative_return[pair] = pair_returns[pair].iloc[-1]
-
-    return cumulative_return
+    # Calculate cumulative returns for all pairs at once and keep the one of the last day
+    return analytics.cumulative_returns(returns).iloc[-1].to_dict()
 
-def visualize_strategy_performance(strategy_returns):
+def visualize_strategy_performance(strategy_returns, renderer=None):
     """
     Plot cumulative returns for the strategy.
 
+    Every line is downsampled to a few thousand points before it's drawn (see quant_tools.plotting).
+
     Parameters:
     - strategy_returns (DataFrame): Strategy returns based on trading signals.
+    - renderer (ChartRenderer): Saves the charts as files in background processes instead of drawing them here.
     """
     for pair in strategy_returns.columns:
         cumulative_portfolio_returns = (1 + strategy_returns[pair]).cumprod() - 1
+        title = f"Strategy Cumulative Returns over Time for {pair}"
+
+        if renderer is not None:
+            renderer.plot("pair_" + "_".join(map(str, pair)), {"Strategy Performance": cumulative_portfolio_returns * 100}, title=title,
+                          xlabel="Date", ylabel="Cumulative Returns (%)", figsize=(15, 6), grid=True)
+            continue
+
+        cumulative_portfolio_returns = downsample(cumulative_portfolio_returns)
 
         # Plot cumulative returns
         plt.figure(figsize=(15, 6))
         plt.plot(cumulative_portfolio_returns.index, cumulative_portfolio_returns.values * 100)
-        plt.title(f"Strategy Cumulative Returns over Time for {pair}")
+        plt.title(title)
         plt.xlabel("Date")
         plt.ylabel("Cumulative Returns (%)")
         plt.legend(["Strategy Performance"])
         plt.grid(True)
 
-def compute_sharpe_ratio(returns, rfr, cumulative_returns):
+def compute_sharpe_ratio(returns, rfr):
     """
     Calculate Sharpe ratio for the strategy.
 
     Parameters:
     - returns (DataFrame): Strategy returns based on trading signals.
     - rfr (float): Risk-free rate.
-    - cumulative_returns (dict): Cumulative returns for each stock pair.
 
     Returns:
     - results (dict): Sharpe ratio for each stock pair.
     """
-    results = {}
-
-    for col in returns.columns:
-        expected_portfolio_return = (cumulative_returns[col] + 1) ** (1/ (len(returns)/252)) - 1
-        annual_volatility = returns[col].std() * np.sqrt(252)
-
-        # Compute the Sharpe ratio
-        sharpe_ratio = (expected_portfolio_return - rfr) / annual_volatility
-
-        results[col] = sharpe_ratio
-
-    return results
+    # Sharpe ratio = (annual return - rfr) / annual volatility, for all pairs at once
+    return analytics.sharpe_ratio(returns, rfr).to_dict()
 
 # Define constants and parameters
 rfr = 0.02  # Risk-free rate
 std_open = 1  # Z-score threshold for opening positions
-std_out = 0.5  # Z-score threshold for closing positions (currently unused)
+std_out = 0.5  # Z-score threshold for closing positions (only used if hold_positions is True)
+hold_positions = False  # hold positions until the z-score reverts inside of std_out
+z_mode = "full"  # "full" sample z-scores (look-ahead) or "online" z-scores from the data up to each day
 tickers = ['KO', 'PEP', 'ADBE', 'MSFT']  # List of stock tickers to analyze
 start = datetime(2010,1,1)  # Start date for data retrieval
 end = datetime(2018,1,1)  # End date for data retrieval
+price_store = PriceStore("price_store/daily")  # local copy of the downloaded prices, re-runs only download what's missing
 
 # Execute the trading strategy pipeline
-stock_returns, stock_prices = getStockInfo(tickers, start, end)
+stock_returns, stock_prices = getStockInfo(tickers, start, end, store=price_store)
 results_cointegration = cointegration(stock_prices, tickers)
-spreads = spread(results_cointegration)
-z_scores = z_score(spreads)
-returns = trade(stock_prices, spreads, z_scores, std_open, std_out, stock_returns)
+spreads = spread(results_cointegration, stock_prices)
+z_scores = z_score(spreads, z_mode)
+returns = trade(stock_prices, spreads, z_scores, std_open, std_out, stock_returns, hold_positions)
 cum_return = cumulative_returns(returns)
 visualize_strategy_performance(returns)
-sharpe_ratios = compute_sharpe_ratio(returns, rfr, cum_return)
+# with hundreds of pairs save the charts as files in the background instead:
+# from quant_tools.plotting import ChartRenderer
+# with ChartRenderer("charts/pairs") as renderer:
+#     visualize_strategy_performance(returns, renderer)
+sharpe_ratios = compute_sharpe_ratio(returns, rfr)
 
 # Display cumulative returns for each stock pair
 print("Cumulative Returns:")
@@ -0,0 +1,120 @@
+"""
+Benchmark of quant_tools.analytics against the metric code the session scripts used before.
+
+The reference functions below are the calculations as they were written in the scripts. Both versions run
+on the same random returns, the script prints the largest difference and the runtime of each metric.
+
+Run it from the root of the repository:
+    python -m benchmarks.bench_analytics [n_days] [n_strategies]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from quant_tools import analytics
+
+
+# reference implementations (copied from the session scripts)
+
+def reference_pairs_sharpe(returns, rfr):
+    # "Winter 2023: 4. Pairs Trading.py": cumulative_returns + compute_sharpe_ratio
+    results = {}
+    for col in returns.columns:
+        cumulative = (1 + returns[col]).cumprod().iloc[-1] - 1
+        expected_portfolio_return = (cumulative + 1) ** (1 / (len(returns) / 252)) - 1
+        annual_volatility = returns[col].std() * np.sqrt(252)
+        results[col] = (expected_portfolio_return - rfr) / annual_volatility
+    return pd.Series(results)
+
+
+def reference_strategy_stats(returns, rfr):
+    # "Winter 2023: 3.  Mean Reversion.py": getStrategyStats (for the strategy returns of every column)
+    stats = {}
+    for col in returns.columns:
+        df = pd.DataFrame({"Strategy_Returns": returns[col]})
+        df["Strategy_Cumulative_Returns"] = np.exp(df["Strategy_Returns"].cumsum())
+        df["Strategy_High"] = df["Strategy_Cumulative_Returns"].cummax()
+
+        strat = {}
+        strat["Total_Returns"] = df["Strategy_Cumulative_Returns"].iloc[-1] - 1
+        strat["Annual_Returns"] = (strat["Total_Returns"] + 1) ** (1 / (len(df) / 252)) - 1
+        strat["Annual_Volatility"] = df["Strategy_Returns"].std() * np.sqrt(252)
+        strat["Sharpe_Ratio"] = (strat["Annual_Returns"] - rfr) / strat["Annual_Volatility"]
+        df_negative = df[df["Strategy_Returns"] < 0]
+        strat["Sortiono_Ratio"] = (strat["Annual_Returns"] - rfr) / (df_negative["Strategy_Returns"].std() * np.sqrt(252))
+        strat["Max Draw Down"] = ((df["Strategy_Cumulative_Returns"] - df["Strategy_High"]) / df["Strategy_High"]).min()
+        stats[col] = strat
+    return pd.DataFrame(stats)
+
+
+def reference_factor_max_drawdown(returns):
+    # "Winter 2023: 2. Factor-Based Investing.py" (reported as a positive number there)
+    results = {}
+    for col in returns.columns:
+        cumulative_return = (returns[col] + 1).cumprod()
+        results[col] = -((cumulative_return.cummax() - cumulative_return) / cumulative_return.cummax()).max()
+    return pd.Series(results)
+
+
+def reference_intro_beta(returns, benchmark):
+    # "Winter 2023: 1. Intro - Calculating Alpha and Beta (in Quant Connect).py": covariance matrix of the returns
+    results = {}
+    for col in returns.columns:
+        cov_matrix = pd.DataFrame({"market": benchmark, "strategy": returns[col]}).cov()
+        results[col] = cov_matrix.iloc[0, 1] / cov_matrix.iloc[0, 0]
+    return pd.Series(results)
+
+
+def reference_risk_volatility(returns):
+    # "Summer 2023: 4. Session: Risk.py"
+    return pd.Series({col: returns[col].std() * np.sqrt(252) for col in returns.columns})
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(n_days=2520, n_strategies=200, seed=0):
+    rng = np.random.default_rng(seed)
+    returns = pd.DataFrame(rng.normal(0.0003, 0.01, (n_days, n_strategies)), index=pd.bdate_range("2010-01-01", periods=n_days))
+    benchmark = pd.Series(rng.normal(0.0003, 0.01, n_days), index=returns.index)
+    rfr = 0.02
+
+    checks = [
+        ("sharpe_ratio (pairs trading)", reference_pairs_sharpe, (returns, rfr),
+         lambda: analytics.sharpe_ratio(returns, rfr)),
+        ("strategy_stats (mean reversion)", reference_strategy_stats, (returns, rfr),
+         lambda: analytics.strategy_stats(returns, rfr)),
+        ("max_drawdown (factor-based investing)", reference_factor_max_drawdown, (returns,),
+         lambda: analytics.max_drawdown(returns)),
+        ("beta (intro)", reference_intro_beta, (returns, benchmark),
+         lambda: analytics.alpha_beta(returns, benchmark, rfr)[1]),
+        ("annual_volatility (risk)", reference_risk_volatility, (returns,),
+         lambda: analytics.annual_volatility(returns)),
+    ]
+
+    print(f"{n_days} days x {n_strategies} strategies")
+    print(f"{'metric':40} {'max abs diff':>14} {'script (s)':>12} {'analytics (s)':>14} {'speed-up':>10}")
+
+    failed = False
+    for name, reference, args, optimized in checks:
+        expected, reference_time = _timed(reference, *args)
+        result, optimized_time = _timed(optimized)
+
+        difference = np.nanmax(np.abs(np.asarray(expected, dtype=np.float64) - np.asarray(result, dtype=np.float64)))
+        failed |= not difference < 1e-9
+
+        print(f"{name:40} {difference:14.2e} {reference_time:12.4f} {optimized_time:14.4f} {reference_time / optimized_time:9.1f}x")
+
+    if failed:
+        print("MISMATCH: quant_tools.analytics doesn't reproduce the script outputs")
+    return not failed
+
+
+if __name__ == "__main__":
+    arguments = [int(argument) for argument in sys.argv[1:3]]
+    sys.exit(0 if main(*arguments) else 1)
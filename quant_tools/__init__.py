@@ -0,0 +1,6 @@
+"""
+Shared building blocks for the session scripts of the Quant Department.
+
+The session scripts stay the place where the strategies are explained step by step,
+the heavy lifting for large universes / long histories lives in the modules of this package.
+"""
@@ -0,0 +1,302 @@
+"""
+Performance statistics for many strategies at once.
+
+Every metric accepts a Series, a DataFrame or a NumPy array of returns (days x strategies) and is a few
+reductions over the columns of that matrix. Days on which a strategy isn't in the sample (e.g. before a
+ticker was listed) are NaN and are masked out instead of filtering copies of the data.
+
+Returns are simple returns by default, pass log=True for log returns.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _as_matrix(returns):
+    # (days x strategies) float64 matrix + the labels of the strategies (None for arrays)
+    if isinstance(returns, pd.DataFrame):
+        return returns.to_numpy(dtype=np.float64), returns.columns
+    if isinstance(returns, pd.Series):
+        return returns.to_numpy(dtype=np.float64)[:, None], pd.Index([returns.name])
+
+    values = np.asarray(returns, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+
+    return values, None
+
+
+def _output(result, returns):
+    # same "shape" as the input: a Series per column for DataFrames, a number for a single series
+    if isinstance(returns, pd.DataFrame):
+        return pd.Series(result, index=returns.columns)
+    if isinstance(returns, pd.Series) or np.ndim(returns) == 1:
+        return float(result[0])
+
+    return result
+
+
+def _masked_std(values, mask):
+    # standard deviation (ddof=1) of the values where mask is True, NaN with less than two values
+    count = mask.sum(axis=0)
+    x = np.where(mask, values, 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = x.sum(axis=0) / count
+        variance = (np.where(mask, x - mean, 0.0) ** 2).sum(axis=0) / (count - 1)
+
+    return np.where(count > 1, np.sqrt(variance), np.nan)
+
+
+def _wealth(values, valid, log):
+    # growth of 1 unit of money, days that don't belong to a strategy add nothing
+    if log:
+        return np.exp(np.cumsum(np.where(valid, values, 0.0), axis=0))
+
+    return np.cumprod(1 + np.where(valid, values, 0.0), axis=0)
+
+
+def _annual_return(values, valid, log, periods_per_year):
+    # compound annual growth rate
+    n_periods = valid.sum(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return _wealth(values, valid, log)[-1] ** (1 / (n_periods / periods_per_year)) - 1
+
+
+def _max_drawdown(wealth):
+    high = np.maximum.accumulate(wealth, axis=0)
+    return ((wealth - high) / high).min(axis=0)
+
+
+def cumulative_returns(returns, log=False):
+    """
+    Cumulative return up to every day.
+
+    Parameters:
+    - returns (Series/DataFrame/ndarray): Returns (days x strategies).
+    - log (bool): True if the returns are log returns.
+
+    Returns:
+    - cumulative_returns (same type as returns): Cumulative return (e.g. 0.1 = +10%) on every day.
+    """
+    values, _ = _as_matrix(returns)
+    cumulative = _wealth(values, ~np.isnan(values), log) - 1
+
+    if isinstance(returns, pd.DataFrame):
+        return pd.DataFrame(cumulative, index=returns.index, columns=returns.columns)
+    if isinstance(returns, pd.Series):
+        return pd.Series(cumulative[:, 0], index=returns.index, name=returns.name)
+    if np.ndim(returns) == 1:
+        return cumulative[:, 0]
+
+    return cumulative
+
+
+def annual_return(returns, log=False, periods_per_year=252):
+    """
+    Compound annual growth rate.
+
+    Parameters:
+    - returns (Series/DataFrame/ndarray): Returns (days x strategies).
+    - log (bool): True if the returns are log returns.
+    - periods_per_year (int): Number of periods per year (252 for daily, 52 for weekly returns).
+
+    Returns:
+    - annual_return (float/Series/ndarray): Annual return of each strategy.
+    """
+    values, _ = _as_matrix(returns)
+    return _output(_annual_return(values, ~np.isnan(values), log, periods_per_year), returns)
+
+
+def annual_volatility(returns, periods_per_year=252):
+    """
+    Annualized standard deviation of the returns.
+
+    Parameters:
+    - returns (Series/DataFrame/ndarray): Returns (days x strategies).
+    - periods_per_year (int): Number of periods per year.
+
+    Returns:
+    - annual_volatility (float/Series/ndarray): Annual volatility of each strategy.
+    """
+    values, _ = _as_matrix(returns)
+    return _output(_masked_std(values, ~np.isnan(values)) * np.sqrt(periods_per_year), returns)
+
+
+def sharpe_ratio(returns, rfr=0.0, log=False, periods_per_year=252):
+    """
+    Sharpe ratio = (annual return - risk-free rate) / annual volatility.
+
+    Parameters:
+    - returns (Series/DataFrame/ndarray): Returns (days x strategies).
+    - rfr (float): Risk-free rate.
+    - log (bool): True if the returns are log returns.
+    - periods_per_year (int): Number of periods per year.
+
+    Returns:
+    - sharpe_ratio (float/Series/ndarray): Sharpe ratio of each strategy.
+    """
+    values, _ = _as_matrix(returns)
+    valid = ~np.isnan(values)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = (_annual_return(values, valid, log, periods_per_year) - rfr) / (_masked_std(values, valid) * np.sqrt(periods_per_year))
+
+    return _output(result, returns)
+
+
+def sortino_ratio(returns, rfr=0.0, log=False, periods_per_year=252):
+    """
+    Sortino ratio = (annual return - risk-free rate) / annual volatility of the negative returns.
+
+    Parameters:
+    - returns (Series/DataFrame/ndarray): Returns (days x strategies).
+    - rfr (float): Risk-free rate.
+    - log (bool): True if the returns are log returns.
+    - periods_per_year (int): Number of periods per year.
+
+    Returns:
+    - sortino_ratio (float/Series/ndarray): Sortino ratio of each strategy.
+    """
+    values, _ = _as_matrix(returns)
+    valid = ~np.isnan(values)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        downside = _masked_std(values, valid & (values < 0)) * np.sqrt(periods_per_year)
+        result = (_annual_return(values, valid, log, periods_per_year) - rfr) / downside
+
+    return _output(result, returns)
+
+
+def max_drawdown(returns, log=False):
+    """
+    Largest relative loss from a previous high (a negative number, e.g. -0.2 = -20%).
+
+    Parameters:
+    - returns (Series/DataFrame/ndarray): Returns (days x strategies).
+    - log (bool): True if the returns are log returns.
+
+    Returns:
+    - max_drawdown (float/Series/ndarray): Max drawdown of each strategy.
+    """
+    values, _ = _as_matrix(returns)
+    return _output(_max_drawdown(_wealth(values, ~np.isnan(values), log)), returns)
+
+
+def alpha_beta(returns, benchmark, rfr=0.0, log=False, periods_per_year=252):
+    """
+    Beta and (Jensen's) alpha of every strategy against a benchmark.
+
+    beta = cov(strategy, benchmark) / var(benchmark)
+    alpha = annual return - risk-free rate - beta * (annual return of the benchmark - risk-free rate)
+
+    Parameters:
+    - returns (Series/DataFrame/ndarray): Returns (days x strategies).
+    - benchmark (Series/ndarray): Returns of the benchmark on the same days.
+    - rfr (float): Risk-free rate.
+    - log (bool): True if the returns are log returns.
+    - periods_per_year (int): Number of periods per year.
+
+    Returns:
+    - alpha (float/Series/ndarray): Alpha of each strategy.
+    - beta (float/Series/ndarray): Beta of each strategy.
+    """
+    values, _ = _as_matrix(returns)
+    market = np.asarray(benchmark, dtype=np.float64).reshape(-1)
+
+    # only the days on which both, strategy and benchmark, have a return
+    valid = ~np.isnan(values)
+    both = valid & ~np.isnan(market)[:, None]
+    count = both.sum(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = np.where(both, market[:, None], 0.0)
+        y = np.where(both, values, 0.0)
+        x_dev = np.where(both, x - x.sum(axis=0) / count, 0.0)
+        y_dev = np.where(both, y - y.sum(axis=0) / count, 0.0)
+
+        beta = (x_dev * y_dev).sum(axis=0) / (x_dev * x_dev).sum(axis=0)
+
+        market_valid = ~np.isnan(market)[:, None]
+        market_return = _annual_return(market[:, None], market_valid, log, periods_per_year)[0]
+        alpha = _annual_return(values, valid, log, periods_per_year) - rfr - beta * (market_return - rfr)
+
+    return _output(alpha, returns), _output(beta, returns)
+
+
+def distribution_stats(returns, rfr=0.0, log=False, periods_per_year=252):
+    """
+    Total and annual return, annual volatility, Sharpe ratio, max drawdown, skew and kurtosis for every column.
+
+    Same definitions as the single metrics (skew and excess kurtosis like scipy.stats.skew / kurtosis), but the
+    wealth path and the central moments are computed once and shared, e.g. for thousands of simulated paths.
+
+    Parameters:
+    - returns (Series/DataFrame/ndarray): Returns (days x strategies).
+    - rfr (float): Risk-free rate.
+    - log (bool): True if the returns are log returns.
+    - periods_per_year (int): Number of periods per year.
+
+    Returns:
+    - stats (dict): total_return, annual_return, annual_volatility, sharpe_ratio, max_drawdown, skew and kurtosis,
+      one value per strategy each.
+    """
+    values, _ = _as_matrix(returns)
+    valid = ~np.isnan(values)
+    wealth = _wealth(values, valid, log)
+    count = valid.sum(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        deviations = np.where(valid, values - np.where(valid, values, 0.0).sum(axis=0) / count, 0.0)
+        squared = deviations * deviations
+        m2 = squared.sum(axis=0) / count
+        m3 = (squared * deviations).sum(axis=0) / count
+        m4 = (squared * squared).sum(axis=0) / count
+
+        annual_returns = wealth[-1] ** (1 / (count / periods_per_year)) - 1
+        annual_volatility = np.where(count > 1, np.sqrt(m2 * count / (count - 1)), np.nan) * np.sqrt(periods_per_year)
+
+        stats = {
+            "total_return": wealth[-1] - 1,
+            "annual_return": annual_returns,
+            "annual_volatility": annual_volatility,
+            "sharpe_ratio": (annual_returns - rfr) / annual_volatility,
+            "max_drawdown": _max_drawdown(wealth),
+            "skew": m3 / m2 ** 1.5,
+            "kurtosis": m4 / m2 ** 2 - 3,
+        }
+
+    return {name: _output(metric, returns) for name, metric in stats.items()}
+
+
+def strategy_stats(returns, rfr=0.0, periods_per_year=252):
+    """
+    Total and annual return, annual volatility, Sharpe and Sortino ratio and max drawdown for every column.
+
+    Parameters:
+    - returns (DataFrame/ndarray): Log returns (days x strategies), NaN on days that don't belong to a strategy.
+    - rfr (float): Risk-free rate.
+    - periods_per_year (int): Number of periods per year (252 for daily returns).
+
+    Returns:
+    - stats (DataFrame): One row per statistic, one column per strategy.
+    """
+    values, labels = _as_matrix(returns)
+    valid = ~np.isnan(values)
+    wealth = _wealth(values, valid, log=True)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        annual_returns = _annual_return(values, valid, True, periods_per_year)
+        annual_volatility = _masked_std(values, valid) * np.sqrt(periods_per_year)
+        downside_volatility = _masked_std(values, valid & (values < 0)) * np.sqrt(periods_per_year)
+
+        stats = {
+            "Total_Returns": wealth[-1] - 1,
+            "Annual_Returns": annual_returns,
+            "Annual_Volatility": annual_volatility,
+            "Sharpe_Ratio": (annual_returns - rfr) / annual_volatility,
+            "Sortiono_Ratio": (annual_returns - rfr) / downside_volatility,
+            "Max Draw Down": _max_drawdown(wealth),
+        }
+
+    return pd.DataFrame(stats, index=labels).T
@@ -0,0 +1,168 @@
+"""
+Backtest engine for the gold/silver ratio strategy of the Summer 2023 sessions.
+
+Instead of string signals and one np.where chain per strategy, the engine works with integer codes:
+    - the signal of a day says where the gold/silver ratio is (neutral, above the ceiling, below the floor),
+    - the position of a day is the leg we hold, i.e. a column of the (days x legs) matrix of leg returns.
+All strategy variants are positions columns of one int8 (days x variants) matrix, their returns are
+picked out of the leg returns in one step. The labels of the codes are only needed for display
+(see quant_tools.signals.decode).
+"""
+import numpy as np
+
+from quant_tools import signals
+
+# signal codes
+NEUTRAL = 0
+ABOVE_CEILING = 1  # gold is expensive compared to silver => short gold, long silver
+BELOW_FLOOR = 2  # gold is cheap compared to silver => long gold, short silver
+
+SIGNAL_LABELS = {
+    NEUTRAL: "neutral",
+    ABOVE_CEILING: "short gold long silver",
+    BELOW_FLOOR: "long gold short silver",
+}
+
+# leg codes = columns of the leg returns
+FLAT = 0
+SHORT_GOLD_LONG_SILVER = 1
+LONG_GOLD_SHORT_SILVER = 2
+LONG_SPY = 3
+LONG_BOTH = 4
+
+LEG_LABELS = {
+    FLAT: "flat",
+    SHORT_GOLD_LONG_SILVER: "short gold long silver",
+    LONG_GOLD_SHORT_SILVER: "long gold short silver",
+    LONG_SPY: "long spy",
+    LONG_BOTH: "long both",
+}
+
+PAIR_LEGS = (SHORT_GOLD_LONG_SILVER, LONG_GOLD_SHORT_SILVER)
+
+
+def leg_returns(gold, silver, spy=None):
+    """
+    Log returns of every leg the strategy can hold, with half of the portfolio in gold and half in silver.
+
+    Parameters:
+    - gold (ndarray/Series): Gold prices.
+    - silver (ndarray/Series): Silver prices.
+    - spy (ndarray/Series): SPY prices, NaN returns for the spy leg if not given.
+
+    Returns:
+    - legs (ndarray): (days x legs) log returns, the first day is NaN.
+    """
+    gold = np.asarray(gold, dtype=np.float64)
+    silver = np.asarray(silver, dtype=np.float64)
+
+    gold_return = np.full(len(gold), np.nan)
+    silver_return = np.full(len(silver), np.nan)
+    gold_return[1:] = gold[1:] / gold[:-1] - 1
+    silver_return[1:] = silver[1:] / silver[:-1] - 1
+
+    legs = np.empty((len(gold), 5))
+    legs[:, FLAT] = 0.0
+    legs[:, SHORT_GOLD_LONG_SILVER] = np.log((-0.5) * gold_return + 0.5 * silver_return + 1)
+    legs[:, LONG_GOLD_SHORT_SILVER] = np.log(0.5 * gold_return - 0.5 * silver_return + 1)
+    legs[:, LONG_BOTH] = np.log(0.5 * gold_return + 0.5 * silver_return + 1)
+
+    legs[:, LONG_SPY] = np.nan
+    if spy is not None:
+        legs[1:, LONG_SPY] = np.diff(np.log(np.asarray(spy, dtype=np.float64)))
+
+    return legs
+
+
+def ratio_signal(relative, ceiling, floor, inclusive=False):
+    """
+    Signal codes from the gold/silver ratio and its bands.
+
+    Parameters:
+    - relative (ndarray/Series): Gold/silver ratio.
+    - ceiling (float/ndarray): Upper band, a number or one value per day.
+    - floor (float/ndarray): Lower band, a number or one value per day.
+    - inclusive (bool): If True, touching a band already gives a signal (>= / <= instead of > / <).
+
+    Returns:
+    - signal (ndarray): int8 signal codes.
+    """
+    relative = np.asarray(relative, dtype=np.float64)
+
+    with np.errstate(invalid="ignore"):
+        if inclusive:
+            above, below = relative >= ceiling, relative <= floor
+        else:
+            above, below = relative > ceiling, relative < floor
+
+    # below the floor wins, if the bands should ever cross
+    return signals.select([below, above], [BELOW_FLOOR, ABOVE_CEILING], NEUTRAL)
+
+
+def vix_fallback(vix, level=30, calm=LONG_SPY, stressed=LONG_BOTH):
+    """
+    Regime switch: hold (calm) while the VIX is at or below level, otherwise (stressed).
+
+    Used as fallback of strategy_positions, or with calm=-1 as override (the VIX decides even if there is a signal).
+
+    Returns:
+    - fallback (ndarray): int8 leg code for every day.
+    """
+    with np.errstate(invalid="ignore"):
+        stressed_days = np.asarray(vix, dtype=np.float64) > level
+
+    return signals.select([stressed_days], [stressed], calm)
+
+
+def strategy_positions(signal, fallback, override=None):
+    """
+    Leg codes of a strategy: the pair trade if there is a signal, the fallback leg otherwise.
+
+    Parameters:
+    - signal (ndarray): int8 signal codes.
+    - fallback (int/ndarray): Leg code for neutral days, e.g. LONG_SPY, LONG_BOTH or one leg code per day (vix_fallback).
+    - override (ndarray): Leg code per day that replaces the position on every day, -1 = no override
+                          (e.g. vix_fallback(...) where the VIX is high).
+
+    Returns:
+    - positions (ndarray): int8 leg codes.
+    """
+    positions = signals.map_codes(signal, {ABOVE_CEILING: SHORT_GOLD_LONG_SILVER, BELOW_FLOOR: LONG_GOLD_SHORT_SILVER}, fallback)
+
+    if override is not None:
+        override = np.asarray(override)
+        positions = signals.override(positions, override >= 0, override)
+
+    return positions
+
+
+def run_backtest(legs, positions, lag=0, pair_direction=None):
+    """
+    Returns of any number of strategy variants over the same leg returns.
+
+    Parameters:
+    - legs (ndarray): (days x legs) log returns, see leg_returns.
+    - positions (ndarray): int8 (days x variants) leg codes, see strategy_positions.
+    - lag (int): Number of days between the position and the return it earns (0 = same day, like in the sessions).
+    - pair_direction (ndarray): +1 or -1 per variant, -1 flips the sign of the pair trade returns.
+
+    Returns:
+    - returns (ndarray): (days x variants) log returns, NaN where the leg return is NaN.
+    """
+    positions = np.asarray(positions, dtype=np.int8)
+    if positions.ndim == 1:
+        positions = positions[:, None]
+
+    if lag:
+        # we only know the position at the end of the day => it earns the return of a later day
+        held = np.full_like(positions, FLAT)
+        held[lag:] = positions[:-lag]
+        positions = held
+
+    returns = np.take_along_axis(legs, positions.astype(np.intp), axis=1)
+
+    if pair_direction is not None:
+        in_pair = np.isin(positions, PAIR_LEGS)
+        returns = np.where(in_pair, returns * np.asarray(pair_direction, dtype=np.float64), returns)
+
+    return returns
@@ -0,0 +1,88 @@
+"""
+Walk-forward bands (mean +- z * std) for the gold/silver ratio strategy.
+
+The full-sample mean and std of the sessions use data from the future. Here the bands of each day
+only use the data up to that day, either over a rolling window or over everything so far (expanding).
+The moments come from prefix sums, so the whole series costs O(n) no matter how long the window is.
+"""
+import numpy as np
+import pandas as pd
+
+from quant_tools.mean_reversion import prefix_sums
+
+
+def rolling_mean_std(values, window=None, min_periods=None):
+    """
+    Rolling (or expanding) mean and standard deviation (ddof=1) from prefix sums.
+
+    Parameters:
+    - values (ndarray/Series): Values (days,) or (days x columns), NaN values are skipped.
+    - window (int): Number of days in the window, None for an expanding window.
+    - min_periods (int): Number of values a window needs, defaults to window (rolling) or 2 (expanding).
+
+    Returns:
+    - mean (ndarray): Mean of the window ending on each day, NaN without enough values.
+    - std (ndarray): Standard deviation of the window ending on each day, NaN without enough values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if min_periods is None:
+        min_periods = window if window is not None else 2
+
+    prefix = prefix_sums(values)
+    count, total, total_sq = prefix["count"][1:], prefix["sum"][1:], prefix["sum_sq"][1:]
+
+    if window is not None:
+        # subtract the prefix sums of the day before the window starts
+        count, total, total_sq = count.copy(), total.copy(), total_sq.copy()
+        count[window:] -= prefix["count"][1:-window]
+        total[window:] -= prefix["sum"][1:-window]
+        total_sq[window:] -= prefix["sum_sq"][1:-window]
+
+    enough = count >= max(min_periods, 2)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        variance = np.maximum(total_sq - total * mean, 0.0) / (count - 1)
+
+    mean = np.where(enough, mean + prefix["center"], np.nan)
+    std = np.where(enough, np.sqrt(variance), np.nan)
+
+    return mean, std
+
+
+def walk_forward_bands(values, window=None, z_ceiling=1.5, z_floor=1.5, min_periods=None, refit_every=1, lag=0):
+    """
+    Ceiling (mean + z_ceiling * std) and floor (mean - z_floor * std) for every day without look-ahead.
+
+    Parameters:
+    - values (ndarray/Series): Values, e.g. the gold/silver ratio.
+    - window (int): Number of days for a rolling window, None for an expanding window.
+    - z_ceiling (float): Number of standard deviations above the mean.
+    - z_floor (float): Number of standard deviations below the mean.
+    - min_periods (int): See rolling_mean_std.
+    - refit_every (int): Re-estimate the bands only every (refit_every) days and keep them in between
+                         (e.g. 21 for monthly, 252 for yearly re-estimation).
+    - lag (int): Number of days between the last value used for the bands and the day they're used on.
+
+    Returns:
+    - ceiling (ndarray/Series): Ceiling of each day (a Series if values is a Series).
+    - floor (ndarray/Series): Floor of each day.
+    """
+    mean, std = rolling_mean_std(values, window, min_periods)
+
+    if refit_every > 1:
+        # walk-forward: the estimate of the last re-estimation day is used until the next one
+        last_fit = (np.arange(len(mean)) // refit_every) * refit_every
+        mean, std = mean[last_fit], std[last_fit]
+
+    if lag:
+        mean = np.concatenate([np.full((lag,) + mean.shape[1:], np.nan), mean[:-lag]])
+        std = np.concatenate([np.full((lag,) + std.shape[1:], np.nan), std[:-lag]])
+
+    ceiling = mean + z_ceiling * std
+    floor = mean - z_floor * std
+
+    if isinstance(values, pd.Series):
+        return pd.Series(ceiling, index=values.index), pd.Series(floor, index=values.index)
+
+    return ceiling, floor
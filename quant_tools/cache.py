@@ -0,0 +1,163 @@
+"""
+Persistent on-disk price store in front of the data providers (QuantConnect, yfinance, ...).
+
+Every (ticker, field) is kept in its own folder as two NumPy files (dates and values) that are
+memory-mapped on read, so repeated reads don't copy the data and only the date ranges that
+aren't in the store yet have to be downloaded.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class PriceStore:
+    """
+    Price store partitioned by ticker.
+
+    Use one store per resolution (e.g. "price_store/daily" and "price_store/minute"),
+    the dates of a store are kept with nanosecond precision.
+
+    Parameters:
+    - root (str): Directory the store lives in, it's created if it doesn't exist.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, ticker, field, name):
+        return os.path.join(self.root, ticker, field, name)
+
+    def coverage(self, ticker, field="close"):
+        """
+        Date range that has already been requested for a ticker.
+
+        Returns:
+        - coverage (tuple): (start, end) as Timestamps, None if the ticker isn't in the store.
+        """
+        path = self._path(ticker, field, "coverage.json")
+        if not os.path.exists(path):
+            return None
+
+        with open(path) as file:
+            coverage = json.load(file)
+
+        return pd.Timestamp(coverage["start"]), pd.Timestamp(coverage["end"])
+
+    def missing(self, ticker, start, end, field="close"):
+        """
+        Date ranges in [start, end] that still have to be fetched for a ticker.
+
+        Returns:
+        - ranges (list): List of (start, end) tuples.
+        """
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        coverage = self.coverage(ticker, field)
+
+        if coverage is None:
+            return [(start, end)]
+
+        ranges = []
+        if start < coverage[0]:
+            ranges.append((start, coverage[0]))
+        if end > coverage[1]:
+            ranges.append((coverage[1], end))
+
+        return ranges
+
+    def read(self, ticker, start=None, end=None, field="close"):
+        """
+        Read the prices of a ticker as a Series backed by the memory-mapped file (no copy).
+
+        Returns:
+        - prices (Series): Prices between start and end (inclusive), None if the ticker isn't in the store.
+        """
+        dates_path = self._path(ticker, field, "dates.npy")
+        if not os.path.exists(dates_path):
+            return None
+
+        dates = np.load(dates_path, mmap_mode="r")
+        values = np.load(self._path(ticker, field, "values.npy"), mmap_mode="r")
+
+        # the dates are sorted => the date range is just a slice of the files
+        first = 0 if start is None else np.searchsorted(dates, pd.Timestamp(start).value, side="left")
+        last = len(dates) if end is None else np.searchsorted(dates, pd.Timestamp(end).value, side="right")
+
+        index = pd.DatetimeIndex(dates[first:last].view("datetime64[ns]"), name="date")
+        return pd.Series(values[first:last], index=index, name=ticker, copy=False)
+
+    def write(self, ticker, prices, start, end, field="close"):
+        """
+        Merge newly fetched prices into the store and extend the covered date range.
+
+        Parameters:
+        - ticker (str): Ticker the prices belong to.
+        - prices (Series): Prices with a date index.
+        - start (datetime): Start of the date range that was requested.
+        - end (datetime): End of the date range that was requested.
+        - field (str): Price field.
+        """
+        new = prices.dropna()
+
+        # an empty result may just be a failed request, the range isn't marked as stored so it's fetched again
+        if new.empty:
+            return
+
+        folder = os.path.join(self.root, ticker, field)
+        os.makedirs(folder, exist_ok=True)
+
+        new.index = pd.DatetimeIndex(new.index).as_unit("ns")
+
+        old = self.read(ticker, field=field)
+        if old is not None and len(old):
+            # newly fetched values replace the stored ones on the same date
+            new = pd.concat([old[~old.index.isin(new.index)], new]).sort_index()
+
+        self._save(folder, "dates.npy", new.index.asi8.astype(np.int64))
+        self._save(folder, "values.npy", new.to_numpy(dtype=np.float64))
+
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        coverage = self.coverage(ticker, field)
+        if coverage is not None:
+            start, end = min(start, coverage[0]), max(end, coverage[1])
+
+        tmp_path = os.path.join(folder, "coverage.json.tmp")
+        with open(tmp_path, "w") as file:
+            json.dump({"start": start.isoformat(), "end": end.isoformat()}, file)
+        os.replace(tmp_path, os.path.join(folder, "coverage.json"))
+
+    @staticmethod
+    def _save(folder, name, array):
+        # write to a temporary file first, readers holding a memory map of the old file aren't affected
+        tmp_path = os.path.join(folder, name + ".tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, os.path.join(folder, name))
+
+    def update(self, tickers, start, end, fetch, field="close"):
+        """
+        Fetch everything in [start, end] that isn't in the store yet.
+
+        Tickers that miss the same date range are fetched together, so usually there is one
+        (batched) request per missing range instead of one per ticker.
+
+        Parameters:
+        - tickers (list): List of tickers.
+        - start (datetime): Start date.
+        - end (datetime): End date.
+        - fetch (function): fetch(tickers, start, end) -> DataFrame (dates x tickers) with the prices.
+        - field (str): Price field.
+        """
+        groups = {}
+        for ticker in tickers:
+            for missing_range in self.missing(ticker, start, end, field):
+                groups.setdefault(missing_range, []).append(ticker)
+
+        for (range_start, range_end), group in groups.items():
+            prices = fetch(group, range_start, range_end)
+
+            # tickers without data in the result aren't written (see write)
+            for ticker in group:
+                if ticker in prices.columns:
+                    self.write(ticker, prices[ticker], range_start, range_end, field)
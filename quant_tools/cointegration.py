@@ -0,0 +1,160 @@
+"""
+Cointegration screening for large universes.
+
+Testing every pair with Engle-Granger is O(n^2) tests, so the screening
+    (1) prunes pairs with a cheap correlation / distance pre-filter,
+    (2) looks up p-values that were already computed in an on-disk cache and
+    (3) spreads the remaining tests over a process pool in chunks.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import numpy as np
+from statsmodels.tsa.stattools import coint
+
+# price matrix of the worker process, set once by _init_worker so it isn't sent with every chunk
+_worker_values = None
+
+
+def _init_worker(values):
+    global _worker_values
+    _worker_values = values
+
+
+def _coint_chunk(chunk, values=None):
+    """
+    Run the Engle-Granger test for a chunk of pairs.
+
+    Parameters:
+    - chunk (list): List of (column of y, column of x) index tuples.
+    - values (ndarray): Price matrix (days x tickers), defaults to the matrix of the worker process.
+
+    Returns:
+    - p_values (list): P-value for each pair in the chunk.
+    """
+    if values is None:
+        values = _worker_values
+
+    return [coint(values[:, i], values[:, j])[1] for i, j in chunk]
+
+
+def prefilter_pairs(data, pairs, min_correlation=None, max_pairs=None):
+    """
+    Prune pairs before running the (expensive) cointegration test.
+
+    Parameters:
+    - data (DataFrame): Stock price data (usually log prices).
+    - pairs (list): List of (ticker, ticker) tuples.
+    - min_correlation (float): Keep only pairs whose prices have at least this correlation.
+    - max_pairs (int): Keep only this many pairs with the smallest distance between their normalized prices.
+
+    Returns:
+    - pairs (list): Remaining pairs.
+    """
+    if min_correlation is None and max_pairs is None:
+        return list(pairs)
+
+    position = {ticker: i for i, ticker in enumerate(data.columns)}
+    first = np.array([position[pair[0]] for pair in pairs], dtype=np.intp)
+    second = np.array([position[pair[1]] for pair in pairs], dtype=np.intp)
+
+    values = data.to_numpy(dtype=np.float64)
+    keep = np.ones(len(pairs), dtype=bool)
+
+    if min_correlation is not None:
+        # one correlation matrix for the whole universe instead of one per pair
+        correlation = np.corrcoef(values, rowvar=False)
+        keep &= correlation[first, second] >= min_correlation
+
+    if max_pairs is not None and keep.sum() > max_pairs:
+        # sum of squared differences between the prices normalized to their first value
+        # ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b  => only needs one (tickers x tickers) gram matrix
+        normalized = values - values[0]
+        gram = normalized.T @ normalized
+        norms = np.diag(gram)
+        distance = norms[first] + norms[second] - 2 * gram[first, second]
+
+        distance = np.where(keep, distance, np.inf)
+        keep = np.zeros(len(pairs), dtype=bool)
+        keep[np.argsort(distance, kind="stable")[:max_pairs]] = True
+
+    return [pair for pair, k in zip(pairs, keep) if k]
+
+
+def _cache_key(pair, data):
+    # the p-value depends on the order of the pair (y on x) and on the date range it was estimated on
+    return f"{pair[0]}|{pair[1]}|{data.index[0]}|{data.index[-1]}"
+
+
+def _load_cache(path):
+    if path is None or not os.path.exists(path):
+        return {}
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def _save_cache(path, cache):
+    # write to a temporary file first, so an interrupted run can't corrupt the cache
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(cache, file)
+    os.replace(tmp_path, path)
+
+
+def screen_pairs(data, tickers=None, min_correlation=None, max_pairs=None, n_jobs=None, chunk_size=500, cache_path=None):
+    """
+    Compute the Engle-Granger p-values for all (pre-filtered) pairs of tickers.
+
+    Parameters:
+    - data (DataFrame): Stock price data (usually log prices).
+    - tickers (list): List of tickers, defaults to all columns of data.
+    - min_correlation (float): Pre-filter, see prefilter_pairs.
+    - max_pairs (int): Pre-filter, see prefilter_pairs.
+    - n_jobs (int): Number of worker processes, 1 runs everything in this process (None = all cores).
+    - chunk_size (int): Number of pairs each worker tests per task.
+    - cache_path (str): JSON file the p-values are cached in, None disables the cache.
+
+    Returns:
+    - p_values (dict): P-value for each tested pair.
+    """
+    if tickers is None:
+        tickers = list(data.columns)
+
+    pairs = prefilter_pairs(data, list(combinations(tickers, 2)), min_correlation, max_pairs)
+
+    # only test the pairs that aren't already in the cache
+    cache = _load_cache(cache_path)
+    p_values = {}
+    missing = []
+
+    for pair in pairs:
+        key = _cache_key(pair, data)
+        if key in cache:
+            p_values[pair] = cache[key]
+        else:
+            missing.append(pair)
+
+    if missing:
+        position = {ticker: i for i, ticker in enumerate(data.columns)}
+        values = data.to_numpy(dtype=np.float64)
+        indices = [(position[pair[0]], position[pair[1]]) for pair in missing]
+        chunks = [indices[i:i + chunk_size] for i in range(0, len(indices), chunk_size)]
+
+        if n_jobs == 1 or len(chunks) == 1:
+            results = [_coint_chunk(chunk, values) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(values,)) as pool:
+                results = list(pool.map(_coint_chunk, chunks))
+
+        for pair, p_value in zip(missing, (p for chunk in results for p in chunk)):
+            p_values[pair] = p_value
+            cache[_cache_key(pair, data)] = p_value
+
+        if cache_path is not None:
+            _save_cache(cache_path, cache)
+
+    # same order as the pairs were formed in
+    return {pair: p_values[pair] for pair in pairs}
@@ -0,0 +1,189 @@
+"""
+Covariance estimators for big universes (hundreds or thousands of stocks instead of 4-6 ETFs).
+
+The sample covariance of the factor sessions (risk_models.sample_cov) gets noisy and ill-conditioned once there
+are many assets compared to the number of days. This module offers:
+- ledoit_wolf: the sample covariance shrunk towards a constant variance target
+- ewma_cov: exponentially weighted covariance (recent days count more), one matrix product instead of a pandas
+  ewm per pair of assets
+- factor_model: low-rank covariance from a regression on factor returns (e.g. QUAL, MTUM, VLUE, SIZE), stored as
+  loadings + factor covariance + specific variances, O(assets x factors) instead of O(assets^2)
+
+All estimators take prices (or returns with returns_data=True) like pypfopt and are annualized with frequency.
+Days on which an asset has no return are left out for all assets.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _returns(prices, returns_data):
+    # complete rows of simple returns (days x assets) + the names of the assets
+    returns = prices if returns_data else prices.pct_change().iloc[1:]
+    values = returns.to_numpy(dtype=np.float64)
+
+    return values[~np.isnan(values).any(axis=1)], returns.columns
+
+
+def ledoit_wolf(prices, returns_data=False, frequency=252):
+    """
+    Ledoit-Wolf shrinkage covariance (constant variance target), like CovarianceShrinkage.ledoit_wolf.
+
+    The shrinkage intensity is chosen from the data, the result is always well-conditioned, even with more
+    assets than days.
+
+    Parameters:
+    - prices (DataFrame): Prices of the assets (days x assets).
+    - returns_data (bool): True if prices already contains returns.
+    - frequency (int): Number of periods per year.
+
+    Returns:
+    - cov (DataFrame): Annualized covariance matrix.
+    """
+    values, assets = _returns(prices, returns_data)
+    n_days, n_assets = values.shape
+
+    centered = values - values.mean(axis=0)
+    sample = centered.T @ centered / n_days
+    target = np.trace(sample) / n_assets
+
+    # optimal shrinkage intensity (Ledoit & Wolf 2004)
+    squared = centered ** 2
+    beta = ((squared.T @ squared).sum() / n_days - (sample ** 2).sum()) / (n_assets * n_days)
+    delta = ((sample ** 2).sum() - 2 * target * np.trace(sample) + n_assets * target ** 2) / n_assets
+    shrinkage = 0.0 if delta == 0 else min(beta, delta) / delta
+
+    cov = (1 - shrinkage) * sample
+    cov[np.diag_indices(n_assets)] += shrinkage * target
+
+    return pd.DataFrame(cov * frequency, index=assets, columns=assets)
+
+
+def ewma_cov(prices, returns_data=False, span=180, frequency=252):
+    """
+    Exponentially weighted covariance, like risk_models.exp_cov.
+
+    Parameters:
+    - prices (DataFrame): Prices of the assets (days x assets).
+    - returns_data (bool): True if prices already contains returns.
+    - span (int): Span of the exponential weights (in days).
+    - frequency (int): Number of periods per year.
+
+    Returns:
+    - cov (DataFrame): Annualized covariance matrix.
+    """
+    values, assets = _returns(prices, returns_data)
+
+    # weights of ewm(span).mean() on the last day: (1 - alpha)^age, normalized
+    alpha = 2 / (span + 1)
+    weights = (1 - alpha) ** np.arange(len(values) - 1, -1, -1)
+    weights /= weights.sum()
+
+    centered = values - values.mean(axis=0)
+    cov = (centered * weights[:, None]).T @ centered
+
+    return pd.DataFrame(cov * frequency, index=assets, columns=assets)
+
+
+class FactorCovariance:
+    """
+    Covariance matrix of a factor model: loadings @ factor_cov @ loadings.T + diag(specific).
+
+    Only the loadings (assets x factors), the factor covariance (factors x factors) and the specific variances
+    (assets) are stored. Products with weights never build the dense matrix, so the optimizers of
+    quant_tools.portfolio accept this object in place of a covariance matrix (w @ cov, cov @ w, w @ cov @ w).
+    to_dense gives the full matrix, e.g. for EfficientFrontier.
+
+    Parameters:
+    - loadings (ndarray): Exposure of every asset to every factor (assets x factors).
+    - factor_cov (ndarray): Covariance matrix of the factors.
+    - specific (ndarray): Specific (residual) variance of every asset.
+    - assets (Index): Names of the assets.
+    - factors (Index): Names of the factors.
+    """
+
+    # let numpy hand w @ cov over to __rmatmul__ instead of converting this object into an array
+    __array_ufunc__ = None
+
+    def __init__(self, loadings, factor_cov, specific, assets=None, factors=None):
+        self.loadings = np.asarray(loadings, dtype=np.float64)
+        self.factor_cov = np.asarray(factor_cov, dtype=np.float64)
+        self.specific = np.asarray(specific, dtype=np.float64)
+        self.assets = pd.RangeIndex(len(self.specific)) if assets is None else pd.Index(assets)
+        self.factors = pd.RangeIndex(len(self.factor_cov)) if factors is None else pd.Index(factors)
+
+    def __len__(self):
+        return len(self.specific)
+
+    @property
+    def shape(self):
+        return len(self.specific), len(self.specific)
+
+    def __matmul__(self, weights):
+        # cov @ w (or cov @ W for a matrix of weights, one portfolio per column)
+        weights = np.asarray(weights, dtype=np.float64)
+        specific = self.specific if weights.ndim == 1 else self.specific[:, None]
+
+        return self.loadings @ (self.factor_cov @ (self.loadings.T @ weights)) + specific * weights
+
+    def __rmatmul__(self, weights):
+        # w @ cov, the matrix is symmetric
+        return (self @ np.asarray(weights, dtype=np.float64).T).T
+
+    def variance(self, weights):
+        """
+        Variance of a portfolio.
+
+        Parameters:
+        - weights (ndarray): Weights of the assets.
+
+        Returns:
+        - variance (float): Variance of the portfolio.
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        exposure = self.loadings.T @ weights
+
+        return float(exposure @ self.factor_cov @ exposure + (self.specific * weights ** 2).sum())
+
+    def to_dense(self):
+        """
+        Full covariance matrix (assets x assets), e.g. for EfficientFrontier.
+
+        Returns:
+        - cov (DataFrame): Covariance matrix.
+        """
+        cov = self.loadings @ self.factor_cov @ self.loadings.T
+        cov[np.diag_indices(len(cov))] += self.specific
+
+        return pd.DataFrame(cov, index=self.assets, columns=self.assets)
+
+
+def factor_model(prices, factor_prices, returns_data=False, frequency=252):
+    """
+    Low-rank covariance from a regression of every asset on the factor returns (with an intercept).
+
+    All assets are regressed in one least squares solve, the whole model costs O(days x assets x factors).
+
+    Parameters:
+    - prices (DataFrame): Prices of the assets (days x assets).
+    - factor_prices (DataFrame): Prices of the factors (days x factors), e.g. the QUAL, MTUM, VLUE and SIZE ETFs.
+    - returns_data (bool): True if prices and factor_prices already contain returns.
+    - frequency (int): Number of periods per year.
+
+    Returns:
+    - cov (FactorCovariance): Annualized covariance matrix in factor form.
+    """
+    n_assets = prices.shape[1]
+    combined = pd.concat([prices, factor_prices], axis=1)
+    values, _ = _returns(combined, returns_data)
+    asset_returns, factor_returns = values[:, :n_assets], values[:, n_assets:]
+    n_days, n_factors = factor_returns.shape
+
+    design = np.column_stack([np.ones(n_days), factor_returns])
+    coefficients = np.linalg.lstsq(design, asset_returns, rcond=None)[0]
+    residuals = asset_returns - design @ coefficients
+
+    loadings = coefficients[1:].T
+    factor_cov = np.atleast_2d(np.cov(factor_returns, rowvar=False))
+    specific = (residuals ** 2).sum(axis=0) / (n_days - n_factors - 1)
+
+    return FactorCovariance(loadings, factor_cov * frequency, specific * frequency, prices.columns, factor_prices.columns)
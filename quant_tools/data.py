@@ -0,0 +1,203 @@
+"""
+Loading price histories for a whole list of tickers at once.
+
+The prices come either from QuantConnect (one batched qb.History request for all tickers), from yfinance
+or from a local directory with one CSV/Parquet file per ticker, so the scripts also run offline.
+Optionally a PriceStore (see quant_tools.cache) sits in front of the provider, then only the dates that
+aren't stored locally yet are downloaded.
+"""
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+
+def _default_resolution():
+    # only available inside of QuantConnect, that's why it's imported when it's needed
+    from AlgorithmImports import Resolution
+    return Resolution.Daily
+
+
+def _from_quantbook(qb, tickers, start, end, n_days, resolution, field):
+    if resolution is None:
+        resolution = _default_resolution()
+
+    symbols = {}
+    for ticker in tickers:
+        # tickers that don't exist (or have a typo in them) are reported by load_prices
+        try:
+            symbols[ticker] = qb.AddEquity(ticker).Symbol
+        except KeyError:
+            continue
+
+    if not symbols:
+        return pd.DataFrame()
+
+    # one request for all tickers instead of one per ticker
+    if n_days is not None:
+        history = qb.History(list(symbols.values()), n_days, resolution)
+    else:
+        history = qb.History(list(symbols.values()), start, end, resolution)
+
+    if history.empty:
+        return pd.DataFrame()
+
+    prices = history[field].unstack(level=0)
+
+    # the columns are the symbols (or their string representation) => rename them to the tickers we asked for
+    names = {}
+    for ticker, symbol in symbols.items():
+        names[symbol] = ticker
+        names[str(symbol)] = ticker
+
+    return prices.rename(columns=names)
+
+
+def _from_yahoo(tickers, start, end, field):
+    # only needed for the sessions that use yfinance
+    import yfinance as yf
+
+    data = yf.download(list(tickers), start=start, end=end)
+    if data.empty:
+        return pd.DataFrame()
+
+    prices = data[field.capitalize()]
+    if isinstance(prices, pd.Series):
+        prices = prices.to_frame(tickers[0])
+
+    return prices
+
+
+def _read_local_file(source, ticker, field):
+    # one file per ticker: <source>/<TICKER>.parquet or <source>/<TICKER>.csv with a date column/index
+    for extension in (".parquet", ".csv"):
+        path = os.path.join(source, ticker + extension)
+        if not os.path.exists(path):
+            continue
+
+        if extension == ".parquet":
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_csv(path)
+
+        df.columns = [str(column).lower() for column in df.columns]
+        if "date" in df.columns:
+            df = df.set_index("date")
+        df.index = pd.to_datetime(df.index)
+
+        return df[field].sort_index()
+
+    return None
+
+
+def _from_directory(source, tickers, start, end, n_days, field):
+    columns = {}
+    for ticker in tickers:
+        series = _read_local_file(source, ticker, field)
+        if series is not None:
+            columns[ticker] = series
+
+    if not columns:
+        return pd.DataFrame()
+
+    # concat aligns all tickers on the union of their dates
+    prices = pd.concat(columns, axis=1)
+
+    if start is not None or end is not None:
+        prices = prices.loc[start:end]
+    if n_days is not None:
+        prices = prices.iloc[-n_days:]
+
+    return prices
+
+
+def _fetch(tickers, start, end, n_days, qb, resolution, source, field):
+    if source == "yahoo":
+        return _from_yahoo(tickers, start, end, field)
+    if source is not None:
+        return _from_directory(source, tickers, start, end, n_days, field)
+    if qb is not None:
+        return _from_quantbook(qb, tickers, start, end, n_days, resolution, field)
+
+    raise ValueError("Either a QuantBook (qb) or a data source has to be given.")
+
+
+def _is_daily(resolution):
+    # None is the default resolution (daily)
+    if resolution is None:
+        return True
+    if isinstance(resolution, str):
+        return resolution.lower() == "daily"
+
+    return resolution == _default_resolution()
+
+
+def _from_store(store, tickers, start, end, n_days, fetch, field, resolution=None):
+    if end is None:
+        end = datetime.today()
+
+    if start is None:
+        if n_days is None:
+            raise ValueError("A start date or n_days is needed to read from the price store.")
+        if not _is_daily(resolution):
+            raise ValueError("n_days only works with daily bars for the price store, use start and end instead.")
+
+        # n_days are trading days => go back a bit further in calendar days and cut off the rest below
+        start = end - timedelta(days=int(n_days * 365 / 252) + 10)
+
+    store.update(tickers, start, end, fetch, field)
+
+    columns = {}
+    for ticker in tickers:
+        series = store.read(ticker, start, end, field)
+        if series is not None and len(series):
+            columns[ticker] = series
+
+    if not columns:
+        return pd.DataFrame()
+
+    prices = pd.concat(columns, axis=1)
+    if n_days is not None:
+        prices = prices.iloc[-n_days:]
+
+    return prices
+
+
+def load_prices(tickers, start=None, end=None, n_days=None, qb=None, resolution=None, source=None, field="close", store=None):
+    """
+    Fetch the prices of all tickers and align them on one date index.
+
+    Parameters:
+    - tickers (list): List of stock tickers.
+    - start (datetime): Start date for the data retrieval.
+    - end (datetime): End date for the data retrieval.
+    - n_days (int): Number of bars to fetch instead of start/end (only daily bars with a store).
+    - qb (QuantBook): QuantBook used for the data retrieval (if no source is given).
+    - resolution (Resolution): Resolution of the bars, defaults to Resolution.Daily.
+    - source (str): "yahoo" to download the data with yfinance, or a directory with one <TICKER>.parquet or
+                    <TICKER>.csv file per ticker; None uses QuantConnect.
+    - field (str): Price field to return.
+    - store (PriceStore): Local price store, only the dates that aren't stored yet are fetched from the source.
+
+    Returns:
+    - prices (DataFrame): Prices (dates x tickers), in the order of tickers; tickers without data are left out.
+                          The values are one column-major float64 block, prices.to_numpy() returns it without a copy.
+    """
+    if store is None:
+        prices = _fetch(tickers, start, end, n_days, qb, resolution, source, field)
+    else:
+        def fetch(missing_tickers, missing_start, missing_end):
+            return _fetch(missing_tickers, missing_start, missing_end, None, qb, resolution, source, field)
+
+        prices = _from_store(store, tickers, start, end, n_days, fetch, field, resolution)
+
+    available = [ticker for ticker in tickers if ticker in prices.columns]
+    for ticker in tickers:
+        if ticker not in available:
+            print(f"No data available for {ticker} in the specified date range.")
+
+    # one (dates x tickers) float64 matrix, stored column by column => each ticker's history is contiguous
+    matrix = np.asfortranarray(prices[available].to_numpy(dtype=np.float64))
+
+    return pd.DataFrame(matrix, index=prices.index, columns=available, copy=False)
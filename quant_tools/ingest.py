@@ -0,0 +1,94 @@
+"""
+Fast loading of the Excel data files of the Summer 2023 sessions.
+
+Parsing Excel is slow, so every sheet is converted once into a Parquet file next to it (with the date column
+sorted). Later runs read the Parquet file and only load the columns and the date range that are needed
+(the date filter is pushed down to the Parquet reader, so the other rows aren't even read).
+"""
+import os
+
+import pandas as pd
+
+
+def resolve_path(path):
+    """
+    Find a data file: absolute paths and existing paths are used as they are, every other path is looked up
+    in the directory of the QUANT_DATA_DIR environment variable (default: "data").
+
+    Parameters:
+    - path (str): Path or file name of the data file.
+
+    Returns:
+    - path (str): Path of the data file.
+    """
+    path = os.path.expanduser(path)
+    if os.path.isabs(path) or os.path.exists(path):
+        return path
+
+    return os.path.join(os.environ.get("QUANT_DATA_DIR", "data"), path)
+
+
+def convert_excel(excel_path, parquet_path=None, date_column="date"):
+    """
+    Convert an Excel sheet into a Parquet file, sorted by date.
+
+    Parameters:
+    - excel_path (str): Path of the Excel file.
+    - parquet_path (str): Path of the Parquet file, defaults to the Excel path with a .parquet extension.
+    - date_column (str): Name of the date column.
+
+    Returns:
+    - parquet_path (str): Path of the Parquet file.
+    """
+    if parquet_path is None:
+        parquet_path = os.path.splitext(excel_path)[0] + ".parquet"
+
+    df = pd.read_excel(excel_path)
+    df[date_column] = pd.to_datetime(df[date_column])
+    df = df.sort_values(date_column)
+
+    # write to a temporary file first, so an interrupted conversion doesn't leave a broken file behind
+    tmp_path = parquet_path + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, parquet_path)
+
+    return parquet_path
+
+
+def load_table(path, columns=None, start=None, end=None, date_column="date"):
+    """
+    Load a data file of the sessions with the date as index.
+
+    Excel files are converted into Parquet on the first call (and again if the Excel file changes),
+    afterwards only the Parquet file is read.
+
+    Parameters:
+    - path (str): Path of the Excel or Parquet file (see resolve_path).
+    - columns (list): Columns to load, None loads all columns.
+    - start (str/datetime): First date to load (like df.truncate(before=start)).
+    - end (str/datetime): Last date to load (like df.truncate(after=end)).
+    - date_column (str): Name of the date column.
+
+    Returns:
+    - df (DataFrame): Data with the dates as index.
+    """
+    path = resolve_path(path)
+
+    if path.endswith((".xlsx", ".xls")):
+        parquet_path = os.path.splitext(path)[0] + ".parquet"
+        if not os.path.exists(parquet_path) or os.path.getmtime(parquet_path) < os.path.getmtime(path):
+            convert_excel(path, parquet_path, date_column)
+        path = parquet_path
+
+    filters = []
+    if start is not None:
+        filters.append((date_column, ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append((date_column, "<=", pd.Timestamp(end)))
+
+    if columns is not None:
+        columns = [date_column] + [column for column in columns if column != date_column]
+
+    df = pd.read_parquet(path, columns=columns, filters=filters or None)
+
+    return df.set_index(date_column)
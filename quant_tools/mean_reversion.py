@@ -0,0 +1,474 @@
+"""
+SMA mean reversion engine.
+
+The rolling mean and standard deviation are computed once for all tickers (days x tickers arrays),
+every set of bands (threshold, safety threshold) only adds one int8 signal array and its returns.
+
+For minute bars (years of them for hundreds of tickers) there's an out-of-core mode: the prices of every ticker
+are read in chunks from a PriceStore, MeanReversionState carries the rolling window (the last n_sma prices) and the
+running sums (cumulative returns, highs / lows, moments of the returns) from one chunk to the next, and the
+results of every chunk are written to Parquet files right away. Only one chunk per ticker is ever in memory.
+"""
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from quant_tools.analytics import strategy_stats
+from quant_tools.cache import PriceStore
+from quant_tools.online import OnlineMoments
+
+
+def prefix_sums(values):
+    """
+    Prefix (cumulative) sums that give the moments of any rolling window in O(1) per day.
+
+    The values are centered on their column mean first, this keeps the differences of the
+    cumulative sums (and with that the rolling standard deviation) numerically precise.
+
+    Parameters:
+    - values (ndarray): Prices (days x tickers), NaN before a ticker was listed.
+
+    Returns:
+    - prefix (dict): center, count, sum and sum of squares, each with a leading row of zeros.
+    """
+    center = np.nanmean(values, axis=0)
+    valid = ~np.isnan(values)
+    x = np.where(valid, values - center, 0.0)
+
+    shape = (len(values) + 1,) + values.shape[1:]
+    prefix = {"center": center}
+    for name, column in (("count", valid.astype(np.float64)), ("sum", x), ("sum_sq", x * x)):
+        prefix[name] = np.zeros(shape)
+        np.cumsum(column, axis=0, out=prefix[name][1:])
+
+    return prefix
+
+
+def rolling_moments(prefix, window):
+    """
+    Rolling mean and standard deviation (ddof=1) from prefix sums.
+
+    Parameters:
+    - prefix (dict): Output of prefix_sums.
+    - window (int): Number of days in the window.
+
+    Returns:
+    - sma (ndarray): Rolling mean (days x tickers), NaN as long as the window isn't full.
+    - std (ndarray): Rolling standard deviation, NaN as long as the window isn't full.
+    """
+    days = len(prefix["sum"]) - 1
+    sma = np.full((days,) + prefix["center"].shape, np.nan)
+    std = np.full_like(sma, np.nan)
+
+    if days < window:
+        return sma, std
+
+    # sums over the window ending on each day = difference of two prefix sums
+    count = prefix["count"][window:] - prefix["count"][:-window]
+    total = prefix["sum"][window:] - prefix["sum"][:-window]
+    total_sq = prefix["sum_sq"][window:] - prefix["sum_sq"][:-window]
+
+    full = count == window
+    mean = total / window
+    variance = np.maximum(total_sq - total * mean, 0.0) / (window - 1)
+
+    sma[window-1:] = np.where(full, mean + prefix["center"], np.nan)
+    std[window-1:] = np.where(full, np.sqrt(variance), np.nan)
+
+    return sma, std
+
+
+def band_signal(values, sma, std, threshold, safety_threshold=None):
+    """
+    Long (1) below the lower band, short (-1) above the upper band, otherwise neutral (0).
+
+    With a safety threshold we don't trade if the price is even outside of the safety bands ("safety net").
+
+    Returns:
+    - signal (ndarray): int8 signal (days x tickers).
+    """
+    with np.errstate(invalid="ignore"):
+        short = values > sma + threshold * std
+        long = values < sma - threshold * std
+
+        if safety_threshold is not None:
+            short &= values < sma + safety_threshold * std
+            long &= values > sma - safety_threshold * std
+
+    return np.where(long, 1, np.where(short, -1, 0)).astype(np.int8)
+
+
+def run_mean_reversion(values, n_sma, band_sets, prefix=None):
+    """
+    Simulate the SMA mean reversion strategy for any number of band sets in one pass.
+
+    Like in the session, the first n_sma days of each ticker are dropped (their first return is 0)
+    and the return of a day depends on the signal of the day before.
+
+    Parameters:
+    - values (ndarray): Prices (days x tickers), NaN only before a ticker was listed.
+    - n_sma (int): Number of days for the SMA and STD.
+    - band_sets (list): List of (threshold, safety_threshold) tuples, safety_threshold can be None.
+    - prefix (dict): Prefix sums of values (see prefix_sums), computed if not given.
+                     Runs with different n_sma on the same prices can share them.
+
+    Returns:
+    - results (dict):
+        - start (ndarray): First day (row) of each ticker after dropping the first n_sma days.
+        - sma, std (ndarray): Rolling moments (days x tickers), shared by all band sets.
+        - log_returns (ndarray): Daily log returns, 0 up to the start day.
+        - bah_cumulative (ndarray): Cumulative buy and hold return.
+        - signals (ndarray): int8 signals (band sets x days x tickers).
+        - strategy_returns (ndarray): Daily log returns of the strategy (band sets x days x tickers).
+        - strategy_cumulative (ndarray): Cumulative strategy returns (band sets x days x tickers).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    days = len(values)
+    rows = np.arange(days)[:, None]
+
+    # first listed day + n_sma
+    start = np.argmax(~np.isnan(values), axis=0) + n_sma
+    active = rows > start
+
+    if prefix is None:
+        prefix = prefix_sums(values)
+    sma, std = rolling_moments(prefix, n_sma)
+
+    log_returns = np.zeros_like(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log_returns[1:] = np.log(values[1:] / values[:-1])
+    log_returns = np.where(active, log_returns, 0.0)
+
+    signals = np.empty((len(band_sets),) + values.shape, dtype=np.int8)
+    strategy_returns = np.zeros((len(band_sets),) + values.shape)
+
+    for k, (threshold, safety_threshold) in enumerate(band_sets):
+        signals[k] = band_signal(values, sma, std, threshold, safety_threshold)
+
+        # the return of day t is made with the position from day t-1
+        strategy_returns[k, 1:] = np.where(active[1:], log_returns[1:] * signals[k, :-1], 0.0)
+
+    return {
+        "start": start,
+        "sma": sma,
+        "std": std,
+        "log_returns": log_returns,
+        "bah_cumulative": np.exp(np.cumsum(log_returns, axis=0)),
+        "signals": signals,
+        "strategy_returns": strategy_returns,
+        "strategy_cumulative": np.exp(np.cumsum(strategy_returns, axis=1)),
+    }
+
+
+# prices and prefix sums of the worker process, set once by _init_worker
+_worker_data = None
+
+
+def _init_worker(values, prefix):
+    global _worker_data
+    _worker_data = (values, prefix)
+
+
+def _sweep_task(task, data=None):
+    n_sma, band_sets, rfr = task
+    values, prefix = _worker_data if data is None else data
+
+    results = run_mean_reversion(values, n_sma, band_sets, prefix)
+
+    # (band sets x days x tickers) => (days x band sets * tickers) with NaN before the start of each ticker
+    returns = results["strategy_returns"]
+    rows = np.arange(returns.shape[1])[None, :, None]
+    returns = np.where(rows >= results["start"], returns, np.nan)
+    returns = returns.transpose(1, 0, 2).reshape(returns.shape[1], -1)
+
+    stats = strategy_stats(returns, rfr)
+    stats = {name: stats.loc[name].to_numpy().reshape(len(band_sets), -1) for name in stats.index}
+
+    return n_sma, band_sets, stats
+
+
+def sweep_mean_reversion(prices, n_sma_values, thresholds, safety_thresholds=(None,), rfr=0.02,
+                         n_random=None, seed=None, n_jobs=None, chunk_size=50):
+    """
+    Grid (or random) search over the parameters of the SMA mean reversion strategy.
+
+    The prefix sums of the prices are computed once for the whole search, so every n_sma only costs one
+    O(days x tickers) pass for its rolling moments, which all thresholds with this n_sma share.
+
+    Parameters:
+    - prices (DataFrame): Prices (days x tickers), e.g. from quant_tools.data.load_prices.
+    - n_sma_values (list): SMA windows to test.
+    - thresholds (list): Thresholds (number of std) to test.
+    - safety_thresholds (list): Safety thresholds to test, None means no safety net.
+    - rfr (float): Risk-free rate for the Sharpe and Sortino ratio.
+    - n_random (int): Only test this many randomly drawn combinations of the grid (random search).
+    - seed (int): Seed for the random search.
+    - n_jobs (int): Number of worker processes, 1 runs everything in this process (None = all cores).
+    - chunk_size (int): Number of band sets each task simulates at once (bounds the memory per task).
+
+    Returns:
+    - results (DataFrame): One row per (n_sma, threshold, safety_threshold, ticker) with the metrics of getStrategyStats.
+    """
+    combinations = list(product(n_sma_values, thresholds, safety_thresholds))
+
+    if n_random is not None and n_random < len(combinations):
+        rng = np.random.default_rng(seed)
+        picked = np.sort(rng.choice(len(combinations), size=n_random, replace=False))
+        combinations = [combinations[i] for i in picked]
+
+    # group the combinations by their window => the rolling moments are only computed once per window
+    by_window = {}
+    for n_sma, threshold, safety_threshold in combinations:
+        by_window.setdefault(n_sma, []).append((threshold, safety_threshold))
+
+    tasks = [(n_sma, band_sets[i:i + chunk_size], rfr)
+             for n_sma, band_sets in by_window.items()
+             for i in range(0, len(band_sets), chunk_size)]
+
+    values = prices.to_numpy(dtype=np.float64)
+    prefix = prefix_sums(values)
+
+    if n_jobs == 1 or len(tasks) == 1:
+        outputs = [_sweep_task(task, (values, prefix)) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(values, prefix)) as pool:
+            outputs = list(pool.map(_sweep_task, tasks))
+
+    # one block of rows per task: band set major, ticker minor (the order of the (band sets x tickers) arrays)
+    tickers = np.asarray(prices.columns, dtype=object)
+    frames = []
+    for n_sma, band_sets, stats in outputs:
+        frame = pd.DataFrame({
+            "n_sma": n_sma,
+            "threshold": np.repeat([band_set[0] for band_set in band_sets], len(tickers)),
+            "safety_threshold": np.repeat(np.array([band_set[1] for band_set in band_sets], dtype=object), len(tickers)),
+            "ticker": np.tile(tickers, len(band_sets)),
+        })
+        for name, metric in stats.items():
+            frame[name] = metric.ravel()
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+class MeanReversionState:
+    """
+    SMA mean reversion of one ticker, fed chunk by chunk (e.g. minute bars read from a PriceStore).
+
+    Gives the same results as run_mean_reversion on the whole series: the last n_sma prices are kept so the
+    rolling window continues over the chunk boundaries, the cumulative returns, highs and lows continue from the
+    running log return sums, and the statistics of strategy_stats are collected from running moments.
+
+    Parameters:
+    - n_sma (int): Number of bars for the SMA and STD.
+    - band_sets (list): List of (threshold, safety_threshold) tuples, safety_threshold can be None.
+    """
+
+    def __init__(self, n_sma, band_sets):
+        self.n_sma = n_sma
+        self.band_sets = list(band_sets)
+        n_columns = len(self.band_sets) + 1
+
+        # last n_sma prices, number of bars so far and the last signal of every band set
+        self.tail = np.empty(0)
+        self.rows = 0
+        self.signal = np.zeros(len(self.band_sets), dtype=np.int8)
+
+        # running state of the band sets + buy and hold (last column): sum of the log returns,
+        # high / low of the cumulative return, max drawdown and the moments of all / the negative returns
+        self.log_sum = np.zeros(n_columns)
+        self.high = np.ones(n_columns)
+        self.low = np.ones(n_columns)
+        self.max_drawdown = np.zeros(n_columns)
+        self.moments = OnlineMoments(n_columns)
+        self.downside = OnlineMoments(n_columns)
+
+    def update(self, prices):
+        """
+        Simulate the next chunk of bars.
+
+        Parameters:
+        - prices (Series): Prices of the next bars (date index, no NaN values), name = ticker.
+
+        Returns:
+        - results (list): One DataFrame per band set with the columns of the session (price, SMA, STD, Signal,
+          Log_Returns, Strategy_Returns, Strategy_Cumulative_Returns, ..., BAH_Low), without the first n_sma bars.
+        """
+        values = prices.to_numpy(dtype=np.float64)
+        n_tail = len(self.tail)
+        extended = np.concatenate([self.tail, values])
+
+        sma, std = rolling_moments(prefix_sums(extended[:, None]), self.n_sma)
+        sma, std = sma[n_tail:, 0], std[n_tail:, 0]
+
+        # like run_mean_reversion: the first n_sma bars are dropped, the first kept one has a return of 0
+        rows = self.rows + np.arange(len(values))
+        log_returns = np.zeros(len(extended))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            log_returns[1:] = np.log(extended[1:] / extended[:-1])
+        log_returns = np.where(rows > self.n_sma, log_returns[n_tail:], 0.0)
+
+        signals = np.array([band_signal(values, sma, std, threshold, safety_threshold)
+                            for threshold, safety_threshold in self.band_sets], dtype=np.int8).reshape(-1, len(values))
+
+        # the return of bar t is made with the position from bar t-1 (the last one of the previous chunk for the first bar)
+        previous = np.concatenate([self.signal[:, None], signals[:, :-1]], axis=1)
+        strategy_returns = log_returns * previous
+
+        keep = rows >= self.n_sma
+        returns = np.column_stack([strategy_returns.T, log_returns])[keep]
+
+        cumulative = np.exp(self.log_sum + np.cumsum(returns, axis=0))
+        high = np.maximum(self.high, np.maximum.accumulate(cumulative, axis=0))
+        low = np.minimum(self.low, np.minimum.accumulate(cumulative, axis=0))
+
+        if len(returns):
+            self.log_sum += returns.sum(axis=0)
+            self.high, self.low = high[-1], low[-1]
+            self.max_drawdown = np.minimum(self.max_drawdown, ((cumulative - high) / high).min(axis=0))
+            self.moments.update(returns)
+            self.downside.update(np.where(returns < 0, returns, np.nan))
+        if len(values):
+            self.signal = signals[:, -1]
+            self.tail = extended[-self.n_sma:].copy()
+            self.rows += len(values)
+
+        results = []
+        for k in range(len(self.band_sets)):
+            results.append(pd.DataFrame({
+                prices.name: values[keep],
+                "SMA": sma[keep],
+                "STD": std[keep],
+                "Signal": signals[k, keep],
+                "Log_Returns": returns[:, -1],
+                "Strategy_Returns": returns[:, k],
+                "Strategy_Cumulative_Returns": cumulative[:, k],
+                "Strategy_High": high[:, k],
+                "Strategy_Low": low[:, k],
+                "BAH_Cumulative_Returns": cumulative[:, -1],
+                "BAH_High": high[:, -1],
+                "BAH_Low": low[:, -1],
+            }, index=prices.index[keep]))
+
+        return results
+
+    def stats(self, rfr=0.02, periods_per_year=252):
+        """
+        Statistics of strategy_stats over all bars so far.
+
+        Parameters:
+        - rfr (float): Risk-free rate.
+        - periods_per_year (int): Number of bars per year (252 for daily, 252 * 390 for minute bars).
+
+        Returns:
+        - stats (DataFrame): One row per statistic, one column per band set + "BAH" for buy and hold.
+        """
+        count = self.moments.count
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            wealth = np.exp(self.log_sum)
+            annual_returns = np.where(count > 0, wealth ** (1 / (count / periods_per_year)) - 1, np.nan)
+            annual_volatility = self.moments.std * np.sqrt(periods_per_year)
+            downside_volatility = self.downside.std * np.sqrt(periods_per_year)
+
+            stats = {
+                "Total_Returns": np.where(count > 0, wealth - 1, np.nan),
+                "Annual_Returns": annual_returns,
+                "Annual_Volatility": annual_volatility,
+                "Sharpe_Ratio": (annual_returns - rfr) / annual_volatility,
+                "Sortiono_Ratio": (annual_returns - rfr) / downside_volatility,
+                "Max Draw Down": np.where(count > 0, self.max_drawdown, np.nan),
+            }
+
+        return pd.DataFrame(stats, index=list(range(len(self.band_sets))) + ["BAH"]).T
+
+
+def _chunked_task(task):
+    # simulate one ticker chunk by chunk, every chunk is written to its own file right away
+    ticker, root, field, start, end, n_sma, band_sets, output_dir, chunk_size = task
+
+    prices = PriceStore(root).read(ticker, start, end, field)
+    state = MeanReversionState(n_sma, band_sets)
+    if prices is None:
+        return ticker, state
+
+    folders = [os.path.join(output_dir, f"band_set_{k}", ticker) for k in range(len(band_sets))]
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+        # parts of an earlier run would be read together with the new ones
+        for path in glob.glob(os.path.join(folder, "part-*.parquet")):
+            os.remove(path)
+
+    for part, first in enumerate(range(0, len(prices), chunk_size)):
+        # the store is memory-mapped, only this chunk is read from disk
+        chunk = prices.iloc[first:first + chunk_size]
+        for folder, result in zip(folders, state.update(chunk)):
+            if len(result):
+                result.to_parquet(os.path.join(folder, f"part-{part:05d}.parquet"))
+
+    return ticker, state
+
+
+def run_mean_reversion_chunked(store, tickers, n_sma, band_sets, output_dir, start=None, end=None, rfr=0.02,
+                               periods_per_year=252 * 390, chunk_size=100000, field="close", n_jobs=1):
+    """
+    Out-of-core SMA mean reversion, e.g. for years of minute bars of hundreds of tickers.
+
+    The prices of every ticker are read from the store in chunks of chunk_size bars, so the memory only depends
+    on chunk_size (per worker), not on the length of the history or the number of tickers. The results of every
+    chunk are written to <output_dir>/band_set_<k>/<ticker>/part-<chunk>.parquet, one folder per ticker can be
+    read back with pd.read_parquet(folder) (or with filters / a column selection).
+
+    Parameters:
+    - store (PriceStore): Local price store with the bars (e.g. PriceStore("price_store/minute")).
+    - tickers (list): List of tickers, tickers that aren't in the store get NaN statistics.
+    - n_sma (int): Number of bars for the SMA and STD.
+    - band_sets (list): List of (threshold, safety_threshold) tuples, safety_threshold can be None.
+    - output_dir (str): Directory of the result files.
+    - start (datetime): First bar, None for the start of the store.
+    - end (datetime): Last bar, None for the end of the store.
+    - rfr (float): Risk-free rate for the Sharpe and Sortino ratio.
+    - periods_per_year (int): Number of bars per year (252 * 390 for minute bars of the regular session).
+    - chunk_size (int): Number of bars per chunk.
+    - field (str): Price field.
+    - n_jobs (int): Number of worker processes (one ticker per task), 1 runs everything in this process
+      (None = all cores).
+
+    Returns:
+    - stats (DataFrame): One row per (n_sma, threshold, safety_threshold, ticker) with the metrics of
+      getStrategyStats, like sweep_mean_reversion.
+    - bah_stats (DataFrame): One row per ticker with the metrics of buy and hold.
+    """
+    band_sets = list(band_sets)
+    tasks = [(ticker, store.root, field, start, end, n_sma, band_sets, output_dir, chunk_size) for ticker in tickers]
+
+    if n_jobs == 1 or len(tasks) == 1:
+        outputs = [_chunked_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            outputs = list(pool.map(_chunked_task, tasks))
+
+    frames, bah_stats = [], {}
+    for ticker, state in outputs:
+        stats = state.stats(rfr, periods_per_year)
+        bah_stats[ticker] = stats.pop("BAH")
+
+        frame = pd.DataFrame({
+            "n_sma": n_sma,
+            "threshold": [band_set[0] for band_set in band_sets],
+            "safety_threshold": pd.Series([band_set[1] for band_set in band_sets], dtype=object),
+            "ticker": ticker,
+        })
+        for name in stats.index:
+            frame[name] = stats.loc[name].to_numpy(dtype=np.float64)
+        frames.append(frame)
+
+    # band set major, ticker minor (like sweep_mean_reversion)
+    stats = pd.concat(frames, ignore_index=True)
+    order = np.argsort(np.tile(np.arange(len(band_sets)), len(outputs)), kind="stable")
+
+    return stats.iloc[order].reset_index(drop=True), pd.DataFrame(bah_stats).T
@@ -0,0 +1,280 @@
+"""
+Incremental (online) statistics that are updated one bar at a time.
+
+Every object only keeps O(columns) state, so a new day costs O(columns) work instead of
+recomputing the statistics over the whole history.
+"""
+import numpy as np
+
+
+class OnlineZScore:
+    """
+    Z-scores of many columns (e.g. the spreads of all pairs) from running moments.
+
+    Without a halflife the mean and standard deviation are the expanding ones (Welford's algorithm),
+    with a halflife they're exponentially weighted. The moments only contain data up to and including
+    the current bar, so there's no look-ahead like with the full-sample mean/std.
+
+    Parameters:
+    - n_columns (int): Number of columns (pairs) that are tracked.
+    - halflife (float): Halflife in bars for exponentially weighted moments, None for expanding moments.
+    - min_periods (int): Number of observations a column needs before a z-score is returned.
+    """
+
+    def __init__(self, n_columns, halflife=None, min_periods=2):
+        self.halflife = halflife
+        self.alpha = None if halflife is None else 1 - np.exp(np.log(0.5) / halflife)
+        self.min_periods = min_periods
+
+        self.count = np.zeros(n_columns, dtype=np.int64)
+        self.mean = np.zeros(n_columns, dtype=np.float64)
+        # sum of squared deviations (expanding) or the exponentially weighted variance
+        self.m2 = np.zeros(n_columns, dtype=np.float64)
+
+    @property
+    def std(self):
+        """Current standard deviation of every column."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if self.alpha is None:
+                variance = np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+            else:
+                variance = np.where(self.count > 0, self.m2, np.nan)
+
+        return np.sqrt(variance)
+
+    def update(self, row):
+        """
+        Add the values of a new bar and return their z-scores.
+
+        Parameters:
+        - row (ndarray): One value per column, NaN values are skipped.
+
+        Returns:
+        - z_scores (ndarray): Z-score of every value, NaN if there isn't enough data yet.
+        """
+        row = np.asarray(row, dtype=np.float64)
+        valid = ~np.isnan(row)
+        x = np.where(valid, row, 0.0)
+
+        self.count += valid
+        delta = np.where(valid, x - self.mean, 0.0)
+
+        if self.alpha is None:
+            # Welford: mean_n = mean_n-1 + delta / n, m2_n = m2_n-1 + delta * (x - mean_n)
+            self.mean += np.divide(delta, self.count, out=np.zeros_like(delta), where=valid)
+            self.m2 += delta * np.where(valid, x - self.mean, 0.0)
+        else:
+            # the first observation of a column initializes its mean
+            first = valid & (self.count == 1)
+            increment = np.where(first, delta, self.alpha * delta)
+            self.mean += increment
+            self.m2 = np.where(valid & ~first, (1 - self.alpha) * (self.m2 + delta * increment), self.m2)
+
+        std = self.std
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z_scores = (row - self.mean) / std
+
+        return np.where(valid & (self.count >= self.min_periods) & (std > 0), z_scores, np.nan)
+
+    def transform(self, values):
+        """
+        Feed a block of bars (days x columns) through update, e.g. to warm up on history.
+
+        Parameters:
+        - values (ndarray): Values with one row per bar.
+
+        Returns:
+        - z_scores (ndarray): Z-scores with the same shape as values.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        z_scores = np.empty_like(values)
+
+        for i, row in enumerate(values):
+            z_scores[i] = self.update(row)
+
+        return z_scores
+
+
+class OnlineCovariance:
+    """
+    Running mean and covariance matrix of many columns (e.g. the returns of all assets of a portfolio).
+
+    Rows can be added and removed again, so the same object serves expanding and rolling windows.
+    A block of rows is merged with one rank-one correction of the scatter matrix (Chan et al.), so
+    moving the window by a month costs O(rows * columns^2) instead of recomputing the whole window.
+
+    Parameters:
+    - n_columns (int): Number of columns (assets) that are tracked.
+    """
+
+    def __init__(self, n_columns):
+        self.count = 0
+        self.mean = np.zeros(n_columns, dtype=np.float64)
+        # scatter matrix: sum of the outer products of the deviations from the mean
+        self.m2 = np.zeros((n_columns, n_columns), dtype=np.float64)
+
+    @property
+    def cov(self):
+        """Current sample covariance matrix (ddof=1)."""
+        if self.count < 2:
+            return np.full_like(self.m2, np.nan)
+
+        return self.m2 / (self.count - 1)
+
+    def update(self, rows):
+        """
+        Add a block of rows (rows x columns) to the moments, the rows must not contain NaN values.
+
+        Parameters:
+        - rows (ndarray): Rows that are added.
+        """
+        rows = np.atleast_2d(np.asarray(rows, dtype=np.float64))
+        n_rows = len(rows)
+        if n_rows == 0:
+            return
+
+        rows_mean = rows.mean(axis=0)
+        deviations = rows - rows_mean
+        delta = rows_mean - self.mean
+        count = self.count + n_rows
+
+        self.m2 += deviations.T @ deviations + np.outer(delta, delta) * (self.count * n_rows / count)
+        self.mean += delta * (n_rows / count)
+        self.count = count
+
+    def remove(self, rows):
+        """
+        Remove a block of rows that was added before (e.g. the oldest month of a rolling window).
+
+        Parameters:
+        - rows (ndarray): Rows that are removed.
+        """
+        rows = np.atleast_2d(np.asarray(rows, dtype=np.float64))
+        n_rows = len(rows)
+        if n_rows == 0:
+            return
+
+        count = self.count - n_rows
+        if count <= 0:
+            self.count = 0
+            self.mean[:] = 0.0
+            self.m2[:] = 0.0
+            return
+
+        # undo the merge of update: the mean of the remaining rows and the rank-one correction
+        rows_mean = rows.mean(axis=0)
+        deviations = rows - rows_mean
+        mean = (self.mean * self.count - rows_mean * n_rows) / count
+        delta = rows_mean - mean
+
+        self.m2 -= deviations.T @ deviations + np.outer(delta, delta) * (count * n_rows / self.count)
+        self.mean = mean
+        self.count = count
+
+
+class OnlineMoments:
+    """
+    Running count, mean, higher central moments and a fixed-bin histogram of many columns.
+
+    Two states can be merged exactly (Pébay's formulas), so the statistics of a huge data set (e.g. years of
+    intraday returns) can be collected chunk by chunk or in parallel workers and then combined. Skew and
+    kurtosis are the ones of scipy.stats (biased, excess kurtosis), the histogram counts the values like
+    np.histogram (values outside the bins are counted in below / above).
+
+    Parameters:
+    - n_columns (int): Number of columns (e.g. strategies) that are tracked.
+    - bins (ndarray): Edges of the histogram bins, e.g. np.arange(-10, 10, 0.25), None for no histogram.
+    """
+
+    def __init__(self, n_columns, bins=None):
+        self.count = np.zeros(n_columns, dtype=np.int64)
+        self.mean = np.zeros(n_columns, dtype=np.float64)
+        # sums of the 2nd, 3rd and 4th powers of the deviations from the mean
+        self.m2 = np.zeros(n_columns, dtype=np.float64)
+        self.m3 = np.zeros(n_columns, dtype=np.float64)
+        self.m4 = np.zeros(n_columns, dtype=np.float64)
+
+        self.bins = None if bins is None else np.asarray(bins, dtype=np.float64)
+        n_bins = 0 if bins is None else len(self.bins) - 1
+        self.histogram = np.zeros((n_bins, n_columns), dtype=np.int64)
+        self.below = np.zeros(n_columns, dtype=np.int64)
+        self.above = np.zeros(n_columns, dtype=np.int64)
+
+    @property
+    def std(self):
+        """Current standard deviation (ddof=1) of every column."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(np.where(self.count > 1, self.m2 / (self.count - 1), np.nan))
+
+    @property
+    def skew(self):
+        """Current skewness of every column."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.count) * self.m3 / self.m2 ** 1.5
+
+    @property
+    def kurtosis(self):
+        """Current excess kurtosis of every column."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.count * self.m4 / self.m2 ** 2 - 3
+
+    def _combine(self, count, mean, m2, m3, m4):
+        # merge the moments of another part of the data into this state
+        total = self.count + count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = np.where(total > 0, mean - self.mean, 0.0)
+            n_a, n_b = self.count.astype(np.float64), np.asarray(count, dtype=np.float64)
+            n = np.maximum(total, 1).astype(np.float64)
+
+            new_m4 = (self.m4 + m4 + delta ** 4 * n_a * n_b * (n_a ** 2 - n_a * n_b + n_b ** 2) / n ** 3
+                      + 6 * delta ** 2 * (n_a ** 2 * m2 + n_b ** 2 * self.m2) / n ** 2
+                      + 4 * delta * (n_a * m3 - n_b * self.m3) / n)
+            new_m3 = (self.m3 + m3 + delta ** 3 * n_a * n_b * (n_a - n_b) / n ** 2
+                      + 3 * delta * (n_a * m2 - n_b * self.m2) / n)
+            new_m2 = self.m2 + m2 + delta ** 2 * n_a * n_b / n
+
+        self.mean = self.mean + delta * n_b / n
+        self.m2, self.m3, self.m4 = new_m2, new_m3, new_m4
+        self.count = total
+
+    def update(self, rows):
+        """
+        Add a block of rows (rows x columns), e.g. one bar or one chunk of bars, NaN values are skipped.
+
+        Parameters:
+        - rows (ndarray): Rows that are added.
+        """
+        rows = np.atleast_2d(np.asarray(rows, dtype=np.float64))
+        valid = ~np.isnan(rows)
+        count = valid.sum(axis=0)
+
+        # central moments of the block, then merged into the state
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, np.where(valid, rows, 0.0).sum(axis=0) / count, 0.0)
+        deviations = np.where(valid, rows - mean, 0.0)
+        squared = deviations * deviations
+        self._combine(count, mean, squared.sum(axis=0), (squared * deviations).sum(axis=0), (squared * squared).sum(axis=0))
+
+        if self.bins is not None:
+            n_bins = len(self.bins) - 1
+            index = np.searchsorted(self.bins, rows, side="right") - 1
+            # the last bin includes its right edge (like np.histogram)
+            index = np.where(rows == self.bins[-1], n_bins - 1, index)
+            inside = valid & (index >= 0) & (index < n_bins)
+            columns = np.broadcast_to(np.arange(rows.shape[1]), rows.shape)
+            self.histogram += np.bincount((index * rows.shape[1] + columns)[inside],
+                                          minlength=self.histogram.size).reshape(self.histogram.shape)
+            self.below += (valid & (rows < self.bins[0])).sum(axis=0)
+            self.above += (valid & (rows > self.bins[-1])).sum(axis=0)
+
+    def merge(self, other):
+        """
+        Add the state of another OnlineMoments object (same columns and bins), e.g. the result of a worker.
+
+        Parameters:
+        - other (OnlineMoments): State that is merged into this one.
+        """
+        self._combine(other.count, other.mean, other.m2, other.m3, other.m4)
+        self.histogram += other.histogram
+        self.below += other.below
+        self.above += other.above
@@ -0,0 +1,234 @@
+"""
+Fast charts for long return series and many tickers / pairs.
+
+A chart is only a few thousand pixels wide, so drawing millions of minute bars just costs time. The series are
+downsampled first with a shape-preserving algorithm:
+- "lttb" (Largest-Triangle-Three-Buckets): keeps the points that span the largest triangles, the line looks the same
+- "minmax": keeps the lowest and the highest point of every bucket, no peak or drawdown gets lost
+
+ChartRenderer draws the downsampled lines into image files in background processes (without a screen), so the
+analysis doesn't have to wait for matplotlib, e.g. for one chart per ticker or pair.
+"""
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def _positions(x):
+    # numeric x values for the triangle areas (dates as nanoseconds), counted from the first one so the
+    # prefix sums stay precise
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[ns]").astype(np.int64)
+        return (x - x[0]).astype(np.float64)
+
+    x = x.astype(np.float64)
+    return x - x[0]
+
+
+def lttb(x, y, n_points):
+    """
+    Indices of the points that Largest-Triangle-Three-Buckets keeps.
+
+    Parameters:
+    - x (ndarray): x values (numbers or dates), increasing.
+    - y (ndarray): y values, without NaN values.
+    - n_points (int): Number of points to keep (at least 3).
+
+    Returns:
+    - indices (ndarray): Sorted indices of the kept points, always including the first and the last one.
+    """
+    n = len(y)
+    if n <= n_points or n_points < 3:
+        return np.arange(n)
+
+    x, y = _positions(x), np.asarray(y, dtype=np.float64)
+
+    # the first and the last point are kept, the others are split into n_points - 2 buckets
+    edges = np.linspace(1, n - 1, n_points - 1).astype(np.int64)
+    indices = np.empty(n_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    # third corner of every triangle: the mean of the next bucket (the last point for the last bucket),
+    # all of them at once from prefix sums
+    stops = np.append(edges[2:], n)
+    sum_x, sum_y = np.concatenate([[0.0], np.cumsum(x)]), np.concatenate([[0.0], np.cumsum(y)])
+    next_xs = (sum_x[stops] - sum_x[edges[1:]]) / (stops - edges[1:])
+    next_ys = (sum_y[stops] - sum_y[edges[1:]]) / (stops - edges[1:])
+
+    for bucket in range(n_points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_x, next_y = next_xs[bucket], next_ys[bucket]
+
+        previous = indices[bucket]
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        indices[bucket + 1] = start + np.argmax(area)
+
+    return indices
+
+
+def minmax(y, n_points):
+    """
+    Indices of the lowest and the highest point of every bucket (min/max decimation).
+
+    Parameters:
+    - y (ndarray): y values, without NaN values.
+    - n_points (int): Number of points to keep (2 per bucket).
+
+    Returns:
+    - indices (ndarray): Sorted indices of the kept points, always including the first and the last one.
+    """
+    n = len(y)
+    n_buckets = n_points // 2
+    if n <= n_points or n_buckets < 1:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=np.float64)
+    starts = np.linspace(0, n, n_buckets + 1).astype(np.int64)[:-1]
+
+    # position of the min / max inside of each bucket, from one reduceat over all buckets
+    lowest = np.minimum.reduceat(y, starts)
+    highest = np.maximum.reduceat(y, starts)
+    bucket = np.repeat(np.arange(n_buckets), np.diff(np.append(starts, n)))
+    first_low = np.flatnonzero(y == lowest[bucket])
+    first_high = np.flatnonzero(y == highest[bucket])
+    low = first_low[np.unique(bucket[first_low], return_index=True)[1]]
+    high = first_high[np.unique(bucket[first_high], return_index=True)[1]]
+
+    return np.unique(np.concatenate([[0, n - 1], low, high]))
+
+
+def downsample(series, n_points=2000, method="lttb"):
+    """
+    Downsample a series for plotting, NaN values are dropped.
+
+    Parameters:
+    - series (Series): Values to plot (index = x values, e.g. dates).
+    - n_points (int): Maximum number of points.
+    - method (str): "lttb" or "minmax".
+
+    Returns:
+    - series (Series): The kept points of the series.
+    """
+    series = series.dropna()
+
+    if method == "lttb":
+        indices = lttb(series.index.to_numpy(), series.to_numpy(), n_points)
+    elif method == "minmax":
+        indices = minmax(series.to_numpy(), n_points)
+    else:
+        raise ValueError(f"unknown method: {method}")
+
+    return series.iloc[indices]
+
+
+def _render(path, lines, title, xlabel, ylabel, figsize, grid, dpi):
+    # draw one chart into a file, with the figure API only (no pyplot => no window and no global state)
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    for label, x, y in lines:
+        ax.plot(x, y, label=label)
+
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    if any(label is not None for label, _, _ in lines):
+        ax.legend()
+    if grid:
+        ax.grid(True, alpha=0.5)
+
+    fig.savefig(path, dpi=dpi, bbox_inches="tight")
+
+    return path
+
+
+class ChartRenderer:
+    """
+    Line charts that are downsampled and saved as image files in background processes.
+
+    plot returns at once (with a future of the file path), wait (or leaving a with block) waits for all charts.
+
+    Parameters:
+    - output_dir (str): Directory of the image files (created if it doesn't exist).
+    - n_jobs (int): Number of worker processes, 1 draws in this process (None = all cores).
+    - n_points (int): Maximum number of points per line.
+    - method (str): Downsampling method, "lttb" or "minmax".
+    - file_format (str): Image format, e.g. "png", "svg" or "pdf".
+    - dpi (int): Resolution of the images.
+    """
+
+    def __init__(self, output_dir, n_jobs=None, n_points=2000, method="lttb", file_format="png", dpi=100):
+        self.output_dir = output_dir
+        self.n_points = n_points
+        self.method = method
+        self.file_format = file_format
+        self.dpi = dpi
+        self.futures = []
+        self.pool = None if n_jobs == 1 else ProcessPoolExecutor(max_workers=n_jobs)
+
+        os.makedirs(output_dir, exist_ok=True)
+
+    def plot(self, name, lines, title=None, xlabel=None, ylabel=None, figsize=(12, 5), grid=False):
+        """
+        Draw a line chart into <output_dir>/<name>.<file_format>.
+
+        Parameters:
+        - name (str): File name of the chart (without extension).
+        - lines (dict/Series/DataFrame): Lines to draw: {label: Series}, a Series or one line per column.
+        - title (str): Title of the chart.
+        - xlabel (str): Label of the x axis.
+        - ylabel (str): Label of the y axis.
+        - figsize (tuple): Size of the figure in inches.
+        - grid (bool): Draw a grid.
+
+        Returns:
+        - future (Future): Future of the path of the file.
+        """
+        if isinstance(lines, pd.Series):
+            lines = {lines.name: lines}
+        elif isinstance(lines, pd.DataFrame):
+            lines = dict(lines.items())
+
+        # downsample here, so only the few kept points are sent to the worker
+        points = []
+        for label, series in lines.items():
+            kept = downsample(series, self.n_points, self.method)
+            points.append((None if label is None else str(label), kept.index.to_numpy(), kept.to_numpy()))
+
+        path = os.path.join(self.output_dir, f"{name}.{self.file_format}")
+        args = (path, points, title, xlabel, ylabel, figsize, grid, self.dpi)
+
+        if self.pool is None:
+            future = Future()
+            future.set_result(_render(*args))
+        else:
+            future = self.pool.submit(_render, *args)
+
+        self.futures.append(future)
+        return future
+
+    def wait(self):
+        """
+        Wait until all charts are saved.
+
+        Returns:
+        - paths (list): Paths of all charts so far.
+        """
+        return [future.result() for future in self.futures]
+
+    def close(self):
+        """Wait for all charts and stop the worker processes."""
+        self.wait()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
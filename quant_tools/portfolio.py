@@ -0,0 +1,429 @@
+"""
+Portfolio optimization for the factor sessions.
+
+The sessions optimize the factor ETF portfolio once on the whole history with pypfopt. Here the portfolio can
+be re-optimized every month (walk-forward) with only the data that was available at that point: the expected
+returns and the covariance matrix are updated with the returns of the last month instead of being recomputed,
+and every optimization starts from the weights of the previous month.
+
+The expected returns and the covariance matrix are the ones of pypfopt (expected_returns.mean_historical_return
+and risk_models.sample_cov), so a single optimization on the whole history gives the weights of the sessions.
+
+efficient_frontier solves a whole grid of portfolios (max Sharpe / min volatility / target return for several
+risk free rates and weight bounds) against one set of estimates, in parallel.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+from quant_tools.covariance import FactorCovariance
+from quant_tools.online import OnlineCovariance
+
+
+def _bounds(weight_bounds, n_assets):
+    # (lower, upper) per asset from one (lower, upper) pair or a list of pairs, None means unbounded
+    if len(weight_bounds) == n_assets and not np.isscalar(weight_bounds[0]):
+        bounds = np.array(weight_bounds, dtype=np.float64)
+    else:
+        bounds = np.tile(np.array(weight_bounds, dtype=np.float64), (n_assets, 1))
+
+    bounds[:, 0] = np.nan_to_num(bounds[:, 0], nan=-1.0)
+    bounds[:, 1] = np.nan_to_num(bounds[:, 1], nan=1.0)
+
+    return bounds
+
+
+def clean_weights(weights, cutoff=1e-4, rounding=5):
+    """
+    Set tiny weights to zero and round the others, like EfficientFrontier.clean_weights.
+
+    Parameters:
+    - weights (ndarray/Series/DataFrame): Weights of the assets.
+    - cutoff (float): Weights with a lower absolute value are set to 0.
+    - rounding (int): Number of decimals, None to skip rounding.
+
+    Returns:
+    - weights (ndarray/Series/DataFrame): Cleaned weights.
+    """
+    if isinstance(weights, (pd.Series, pd.DataFrame)):
+        weights = weights.where(weights.abs() >= cutoff, 0.0)
+    else:
+        weights = np.where(np.abs(weights) >= cutoff, weights, 0.0)
+
+    if rounding is not None:
+        weights = weights.round(rounding)
+
+    return weights
+
+
+def _as_cov(cov):
+    # factor models stay in factor form, everything else becomes a dense float64 matrix
+    if isinstance(cov, FactorCovariance):
+        return cov
+
+    return np.asarray(cov, dtype=np.float64)
+
+
+def _min_variance(cov, bounds, x0, mu=None, target_return=None):
+    # minimize w' cov w with sum(w) = 1 and the bounds (and w' mu >= target_return)
+    n_assets = len(cov)
+    start = np.full(n_assets, 1.0 / n_assets) if x0 is None else x0
+    constraints = [{"type": "eq", "fun": lambda w: w.sum() - 1, "jac": lambda w: np.ones(n_assets)}]
+    if target_return is not None:
+        constraints.append({"type": "ineq", "fun": lambda w: w @ mu - target_return, "jac": lambda w: mu})
+
+    result = minimize(
+        lambda w: w @ cov @ w,
+        np.clip(start, bounds[:, 0], bounds[:, 1]),
+        jac=lambda w: 2 * (cov @ w),
+        bounds=bounds,
+        constraints=constraints,
+        method="SLSQP",
+        options={"ftol": 1e-12, "maxiter": 500},
+    )
+    if not result.success:
+        raise ValueError(f"optimization failed: {result.message}")
+
+    return result.x
+
+
+def portfolio_performance(weights, mu, cov, risk_free_rate=0.02):
+    """
+    Expected return, volatility and Sharpe ratio of a portfolio, like EfficientFrontier.portfolio_performance.
+
+    Parameters:
+    - weights (ndarray): Weights of the assets.
+    - mu (ndarray): Expected (annual) returns of the assets.
+    - cov (ndarray): Covariance matrix (annual) of the assets.
+    - risk_free_rate (float): Risk free rate.
+
+    Returns:
+    - expected_return (float): Expected annual return.
+    - volatility (float): Annual volatility.
+    - sharpe_ratio (float): Sharpe ratio.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    expected_return = float(weights @ np.asarray(mu, dtype=np.float64))
+    volatility = float(np.sqrt(weights @ _as_cov(cov) @ weights))
+
+    return expected_return, volatility, (expected_return - risk_free_rate) / volatility
+
+
+def min_volatility(cov, weight_bounds=(0, 1), x0=None):
+    """
+    Weights of the fully invested portfolio with the lowest volatility.
+
+    Parameters:
+    - cov (ndarray): Covariance matrix (annual) of the assets.
+    - weight_bounds (tuple/list): (lower, upper) bounds for every weight or a list with one pair per asset.
+    - x0 (ndarray): Starting weights, defaults to equal weights.
+
+    Returns:
+    - weights (ndarray): Optimal weights.
+    """
+    cov = _as_cov(cov)
+
+    return _min_variance(cov, _bounds(weight_bounds, len(cov)), x0)
+
+
+def efficient_return(mu, cov, target_return, weight_bounds=(0, 1), x0=None):
+    """
+    Weights of the fully invested portfolio with the lowest volatility that has at least the target return.
+
+    Parameters:
+    - mu (ndarray): Expected (annual) returns of the assets.
+    - cov (ndarray): Covariance matrix (annual) of the assets.
+    - target_return (float): Minimum expected return of the portfolio.
+    - weight_bounds (tuple/list): (lower, upper) bounds for every weight or a list with one pair per asset.
+    - x0 (ndarray): Starting weights (e.g. the weights of a neighbouring target), defaults to equal weights.
+
+    Returns:
+    - weights (ndarray): Optimal weights.
+    """
+    mu = np.asarray(mu, dtype=np.float64)
+    cov = _as_cov(cov)
+
+    if target_return > np.abs(mu).max():
+        raise ValueError("target_return must be lower than the largest expected return")
+
+    return _min_variance(cov, _bounds(weight_bounds, len(mu)), x0, mu, target_return)
+
+
+def max_sharpe(mu, cov, risk_free_rate=0.02, weight_bounds=(0, 1), x0=None):
+    """
+    Weights of the portfolio with the highest Sharpe ratio (fully invested).
+
+    Like EfficientFrontier.max_sharpe the problem is solved in its convex form: minimize y' cov y with
+    (mu - risk_free_rate)' y = 1, sum(y) = k and the bounds scaled by k, the weights are y / k.
+
+    Parameters:
+    - mu (ndarray): Expected (annual) returns of the assets.
+    - cov (ndarray): Covariance matrix (annual) of the assets.
+    - risk_free_rate (float): Risk free rate.
+    - weight_bounds (tuple/list): (lower, upper) bounds for every weight or a list with one pair per asset.
+    - x0 (ndarray): Starting weights (e.g. the weights of the last rebalancing), defaults to equal weights.
+
+    Returns:
+    - weights (ndarray): Optimal weights.
+    """
+    mu = np.asarray(mu, dtype=np.float64)
+    cov = _as_cov(cov)
+    n_assets = len(mu)
+    bounds = _bounds(weight_bounds, n_assets)
+    excess = mu - risk_free_rate
+
+    if not (excess > 0).any():
+        raise ValueError("at least one of the assets must have an expected return exceeding the risk-free rate")
+
+    # starting point in the scaled variables (y, k), so a warm start begins at the previous optimum
+    if x0 is None:
+        weights = np.full(n_assets, 1.0 / n_assets)
+    else:
+        weights = np.clip(np.asarray(x0, dtype=np.float64), bounds[:, 0], bounds[:, 1])
+    scale = excess @ weights
+    if scale <= 0:
+        weights = (excess > 0) / (excess > 0).sum()
+        scale = excess @ weights
+    start = np.append(weights, 1.0) / scale
+
+    eye = np.eye(n_assets)
+    constraints = [
+        {"type": "eq", "fun": lambda x: excess @ x[:-1] - 1, "jac": lambda x: np.append(excess, 0.0)},
+        {"type": "eq", "fun": lambda x: x[:-1].sum() - x[-1], "jac": lambda x: np.append(np.ones(n_assets), -1.0)},
+        {"type": "ineq", "fun": lambda x: x[:-1] - bounds[:, 0] * x[-1], "jac": lambda x: np.column_stack([eye, -bounds[:, 0]])},
+        {"type": "ineq", "fun": lambda x: bounds[:, 1] * x[-1] - x[:-1], "jac": lambda x: np.column_stack([-eye, bounds[:, 1]])},
+    ]
+
+    result = minimize(
+        lambda x: x[:-1] @ cov @ x[:-1],
+        start,
+        jac=lambda x: np.append(2 * (cov @ x[:-1]), 0.0),
+        bounds=[(None, None)] * n_assets + [(0, None)],
+        constraints=constraints,
+        method="SLSQP",
+        options={"ftol": 1e-12, "maxiter": 500},
+    )
+    if not result.success:
+        raise ValueError(f"optimization failed: {result.message}")
+
+    return result.x[:-1] / result.x[-1]
+
+
+def rebalance_max_sharpe(prices, window=None, freq="M", risk_free_rate=0.02, weight_bounds=(0, 1),
+                         min_periods=252, periods_per_year=252):
+    """
+    Walk-forward max Sharpe portfolio: re-optimize the weights at the end of every period (e.g. month).
+
+    The moments are updated with the returns since the last rebalancing (and the returns that drop out of a
+    rolling window are removed), every optimization is warm-started from the last weights. Days on which an
+    asset has no return (e.g. before it was listed) are left out for all assets.
+    If no asset beats the risk free rate (or the bounds can't be met) the last weights are kept.
+
+    Parameters:
+    - prices (DataFrame): Prices of the assets (days x assets).
+    - window (int): Number of days of returns used for the estimates, None to use all the data so far.
+    - freq (str): Rebalancing frequency as a pandas period ("M" = monthly, "Q" = quarterly, "W" = weekly).
+    - risk_free_rate (float): Risk free rate.
+    - weight_bounds (tuple/list): Bounds of the weights (see max_sharpe).
+    - min_periods (int): Number of days of returns needed before the first optimization.
+    - periods_per_year (int): Number of periods per year, used to annualize the moments.
+
+    Returns:
+    - weights (DataFrame): Weights of the assets, one row per rebalancing date (valid from the next day on).
+    """
+    returns = prices.pct_change().iloc[1:]
+    values = returns.to_numpy(dtype=np.float64)
+    complete = ~np.isnan(values).any(axis=1)
+
+    # the last day of every period (and the last day of the data)
+    periods = returns.index.to_period(freq)
+    ends = np.flatnonzero(np.append(periods[1:] != periods[:-1], True))
+
+    moments = OnlineCovariance(values.shape[1])
+    log_total = np.zeros(values.shape[1])
+    start = stop = 0
+    weights = None
+    dates, rows = [], []
+
+    for end in ends:
+        # add the new days of the window, remove the days that drop out of it
+        new = values[stop:end + 1][complete[stop:end + 1]]
+        moments.update(new)
+        log_total += np.log1p(new).sum(axis=0)
+        stop = end + 1
+
+        if window is not None and stop - window > start:
+            old = values[start:stop - window][complete[start:stop - window]]
+            moments.remove(old)
+            log_total -= np.log1p(old).sum(axis=0)
+            start = stop - window
+
+        if moments.count < min_periods:
+            continue
+
+        # mean_historical_return: (1 + r).prod() ** (periods_per_year / n) - 1, sample_cov: cov * periods_per_year
+        mu = np.expm1(log_total / moments.count * periods_per_year)
+        cov = moments.cov * periods_per_year
+
+        try:
+            weights = max_sharpe(mu, cov, risk_free_rate, weight_bounds, x0=weights)
+        except ValueError:
+            if weights is None:
+                continue
+
+        dates.append(returns.index[end])
+        rows.append(weights)
+
+    return pd.DataFrame(rows, index=pd.Index(dates, name=returns.index.name), columns=prices.columns)
+
+
+# expected returns and covariance matrix of the worker process, set once by _init_worker
+_worker_problem = None
+
+
+def _init_worker(mu, cov):
+    global _worker_problem
+    _worker_problem = (mu, cov)
+
+
+def _frontier_task(task, problem=None):
+    # solve the portfolios of one (objective, weight bounds) pair, every solve starts from the last weights
+    mu, cov = _worker_problem if problem is None else problem
+    objective, weight_bounds, risk_free_rates, target_returns = task
+
+    rows = []
+    weights = None
+    if objective == "min_volatility":
+        try:
+            weights = min_volatility(cov, weight_bounds)
+        except ValueError:
+            weights = None
+        rows = [(risk_free_rate, np.nan, weights) for risk_free_rate in risk_free_rates]
+    elif objective == "max_sharpe":
+        for risk_free_rate in risk_free_rates:
+            try:
+                weights = max_sharpe(mu, cov, risk_free_rate, weight_bounds, x0=weights)
+                rows.append((risk_free_rate, np.nan, weights))
+            except ValueError:
+                rows.append((risk_free_rate, np.nan, None))
+    else:
+        for target_return in target_returns:
+            try:
+                weights = efficient_return(mu, cov, target_return, weight_bounds, x0=weights)
+            except ValueError:
+                weights = None
+            rows.extend((risk_free_rate, target_return, weights) for risk_free_rate in risk_free_rates)
+
+    return objective, weight_bounds, rows
+
+
+def efficient_frontier(mu, cov, risk_free_rates=(0.02,), weight_bounds=((0, 1),), target_returns=None,
+                       objectives=("max_sharpe", "min_volatility", "efficient_return"), n_jobs=None, chunk_size=25):
+    """
+    Solve a grid of portfolios against one set of estimates and return them as a frontier table.
+
+    The min volatility and target return portfolios don't depend on the risk free rate, so they're solved once
+    per weight bounds and only their Sharpe ratio is computed for every rate. The target returns are solved in
+    ascending order and every solve starts from the weights of the last one.
+
+    Parameters:
+    - mu (Series/ndarray): Expected (annual) returns of the assets, e.g. expected_returns.mean_historical_return.
+    - cov (DataFrame/ndarray): Covariance matrix (annual) of the assets, e.g. risk_models.sample_cov.
+    - risk_free_rates (list): Risk free rates.
+    - weight_bounds (list): Weight bounds to test, each one (lower, upper) pair or a list with one pair per asset.
+    - target_returns (list): Target returns of the efficient_return portfolios, defaults to 20 returns between
+      the lowest and the highest expected return.
+    - objectives (list): Portfolios to solve: "max_sharpe", "min_volatility" and/or "efficient_return".
+    - n_jobs (int): Number of worker processes, 1 runs everything in this process (None = all cores).
+    - chunk_size (int): Number of target returns per task.
+
+    Returns:
+    - frontier (DataFrame): One row per portfolio with objective, weight_bounds, risk_free_rate, target_return,
+      expected_return, volatility, sharpe_ratio and the weights (NaN if the portfolio is infeasible).
+    """
+    assets = mu.index if isinstance(mu, pd.Series) else getattr(cov, "columns", getattr(cov, "assets", None))
+    mu = np.asarray(mu, dtype=np.float64)
+    cov = _as_cov(cov)
+    if assets is None:
+        assets = pd.RangeIndex(len(mu))
+    if target_returns is None:
+        target_returns = np.linspace(mu.min(), mu.max(), 20)
+    target_returns = np.sort(np.asarray(target_returns, dtype=np.float64))
+
+    tasks = []
+    for bounds in weight_bounds:
+        for objective in objectives:
+            if objective == "efficient_return":
+                tasks.extend((objective, bounds, risk_free_rates, target_returns[i:i + chunk_size])
+                             for i in range(0, len(target_returns), chunk_size))
+            else:
+                tasks.append((objective, bounds, risk_free_rates, None))
+
+    if n_jobs == 1 or len(tasks) == 1:
+        outputs = [_frontier_task(task, (mu, cov)) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(mu, cov)) as pool:
+            outputs = list(pool.map(_frontier_task, tasks))
+
+    records, weight_rows = [], []
+    for objective, bounds, rows in outputs:
+        for risk_free_rate, target_return, weights in rows:
+            if weights is None:
+                performance = (np.nan, np.nan, np.nan)
+                weights = np.full(len(mu), np.nan)
+            else:
+                performance = portfolio_performance(weights, mu, cov, risk_free_rate)
+            records.append((objective, bounds, risk_free_rate, target_return) + performance)
+            weight_rows.append(weights)
+
+    frontier = pd.DataFrame(records, columns=["objective", "weight_bounds", "risk_free_rate", "target_return",
+                                              "expected_return", "volatility", "sharpe_ratio"])
+    weights = pd.DataFrame(np.array(weight_rows).reshape(len(records), len(mu)), columns=assets)
+
+    return pd.concat([frontier, weights], axis=1)
+
+
+def portfolio_returns(returns, weights, drift=False):
+    """
+    Daily (simple) returns of a portfolio, one matrix-vector product per rebalancing.
+
+    The returns of the weighted assets are selected once (other columns are ignored, missing weights count as 0).
+    Constant weights (a dict like the cleaned weights of EfficientFrontier) apply to every day. Time-varying
+    weights have one row per rebalancing date (like rebalance_max_sharpe), each row applies from the next day on
+    and there's no return (cash) before the first one.
+
+    Parameters:
+    - returns (DataFrame): Simple returns of the assets (days x assets).
+    - weights (dict/Series/DataFrame): Weight per asset, or weights per rebalancing date (dates x assets).
+    - drift (bool): False rebalances back to the weights every day, True lets the weights drift with the prices
+      until the next rebalancing (buy and hold from the first day for constant weights).
+
+    Returns:
+    - portfolio_returns (Series): Simple return of the portfolio on every day.
+    """
+    if isinstance(weights, pd.DataFrame):
+        aligned = weights
+        starts = returns.index.searchsorted(weights.index, side="right")
+    else:
+        aligned = pd.Series(weights).to_frame().T
+        starts = np.array([0])
+
+    missing = aligned.columns.difference(returns.columns)
+    if len(missing) > 0:
+        raise KeyError(f"no returns for {list(missing)}")
+
+    values = returns[aligned.columns].to_numpy(dtype=np.float64)
+    matrix = aligned.fillna(0.0).to_numpy(dtype=np.float64)
+    result = np.zeros(len(values))
+
+    for start, stop, row in zip(starts, np.append(starts[1:], len(values)), matrix):
+        if drift:
+            # value of every position grows with its asset, the portfolio return is the growth of the total value
+            value = np.cumprod(1 + np.nan_to_num(values[start:stop]), axis=0) @ row
+            result[start:stop] = value / np.append(row.sum(), value[:-1]) - 1
+        else:
+            result[start:stop] = values[start:stop] @ row
+
+    return pd.Series(result, index=returns.index, name="portfolio")
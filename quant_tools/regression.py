@@ -0,0 +1,94 @@
+"""
+Rolling regression of many assets against one benchmark (e.g. 3,000 stocks against the SPY).
+
+Every window is a regression of the asset returns on the benchmark returns. All its statistics (beta, alpha,
+correlation, residual volatility) follow from six sums over the window: count, x, y, x^2, y^2 and x*y.
+These come from cumulative sums, so a window costs O(1) per day and asset no matter how long it is,
+and only (days x assets) arrays are needed, never an (assets x assets) covariance matrix.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _window_sums(values, window):
+    # sums over the window ending on each day (expanding for window=None), from one cumulative sum
+    sums = np.cumsum(values, axis=0)
+    if window is not None and window < len(sums):
+        sums[window:] -= sums[:-window].copy()
+
+    return sums
+
+
+def rolling_regression(returns, benchmark, window=90, min_periods=None, rfr=0.0, periods_per_year=252,
+                       chunk_size=500):
+    """
+    Rolling beta, alpha, correlation and residual volatility of every asset against a benchmark.
+
+    beta = cov(asset, benchmark) / var(benchmark) and alpha = mean daily excess return - beta * mean daily excess
+    return of the benchmark, times periods_per_year (the arithmetic alpha, i.e. the annualized regression intercept).
+    quant_tools.analytics.alpha_beta uses compound annual returns instead, so its alpha differs from this one.
+    Only days on which both the asset and the benchmark have a return are used.
+
+    Parameters:
+    - returns (DataFrame/ndarray): Returns of the assets (days x assets).
+    - benchmark (Series/ndarray): Returns of the benchmark on the same days.
+    - window (int): Number of days in the window, None for an expanding window.
+    - min_periods (int): Number of days with returns a window needs, defaults to window (rolling) or 2 (expanding).
+    - rfr (float): Annual risk-free rate.
+    - periods_per_year (int): Number of periods per year, used to annualize alpha and the residual volatility.
+    - chunk_size (int): Number of assets processed at once (bounds the memory for big universes).
+
+    Returns:
+    - results (dict): "beta", "alpha", "correlation" and "residual_volatility", each (days x assets),
+      DataFrames if returns is a DataFrame, NaN where a window doesn't have enough data.
+    """
+    values = np.asarray(returns, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    market = np.asarray(benchmark, dtype=np.float64).reshape(-1)
+    if min_periods is None:
+        min_periods = window if window is not None else 2
+
+    names = ("beta", "alpha", "correlation", "residual_volatility")
+    results = {name: np.full(values.shape, np.nan) for name in names}
+    daily_rfr = rfr / periods_per_year
+
+    # center on the means, this keeps the differences of the cumulative sums precise
+    market_center = np.nanmean(market)
+
+    for start in range(0, values.shape[1], chunk_size):
+        block = values[:, start:start + chunk_size]
+        both = ~np.isnan(block) & ~np.isnan(market)[:, None]
+        center = np.nanmean(block, axis=0)
+        x = np.where(both, market[:, None] - market_center, 0.0)
+        y = np.where(both, block - center, 0.0)
+
+        count = _window_sums(both.astype(np.float64), window)
+        sum_x, sum_y = _window_sums(x, window), _window_sums(y, window)
+        sum_xx, sum_yy, sum_xy = _window_sums(x * x, window), _window_sums(y * y, window), _window_sums(x * y, window)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # sums of the deviations from the window means
+            mean_x, mean_y = sum_x / count, sum_y / count
+            ss_x = np.maximum(sum_xx - sum_x * mean_x, 0.0)
+            ss_y = np.maximum(sum_yy - sum_y * mean_y, 0.0)
+            ss_xy = sum_xy - sum_x * mean_y
+
+            beta = ss_xy / ss_x
+            alpha = (mean_y + center - daily_rfr) - beta * (mean_x + market_center - daily_rfr)
+            correlation = ss_xy / np.sqrt(ss_x * ss_y)
+            residual_variance = np.maximum(ss_y - beta * ss_xy, 0.0) / (count - 2)
+
+        enough = count >= max(min_periods, 2)
+        columns = slice(start, start + block.shape[1])
+        results["beta"][:, columns] = np.where(enough, beta, np.nan)
+        results["alpha"][:, columns] = np.where(enough, alpha * periods_per_year, np.nan)
+        results["correlation"][:, columns] = np.where(enough, correlation, np.nan)
+        results["residual_volatility"][:, columns] = np.where(enough & (count > 2), np.sqrt(residual_variance * periods_per_year), np.nan)
+
+    if isinstance(returns, pd.DataFrame):
+        return {name: pd.DataFrame(result, index=returns.index, columns=returns.columns) for name, result in results.items()}
+    if isinstance(returns, pd.Series):
+        return {name: pd.Series(result[:, 0], index=returns.index, name=returns.name) for name, result in results.items()}
+
+    return results
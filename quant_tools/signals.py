@@ -0,0 +1,96 @@
+"""
+Signals (and positions) as small integer codes with a label map.
+
+Comparing int8 codes is much cheaper than comparing Python strings in an object column, and a column of
+codes takes one byte per row. The labels ("long gold short silver", ...) are only attached for display.
+"""
+import numpy as np
+import pandas as pd
+
+
+def encode(labels, label_map):
+    """
+    Turn string labels (e.g. an old signal column) into codes.
+
+    Parameters:
+    - labels (array-like): String labels.
+    - label_map (dict): {code: label}, the codes have to be 0, 1, 2, ...
+
+    Returns:
+    - codes (ndarray): int8 codes, -1 for labels that aren't in the label map.
+    """
+    categories = [label_map[code] for code in range(len(label_map))]
+    return pd.Categorical(np.asarray(labels, dtype=object), categories=categories).codes.astype(np.int8)
+
+
+def decode(codes, label_map, index=None):
+    """
+    Labels of the codes for display, stored as a categorical (the codes + one copy of each label).
+
+    Parameters:
+    - codes (ndarray/Series): int8 codes.
+    - label_map (dict): {code: label}, the codes have to be 0, 1, 2, ...
+    - index (Index): Index of the returned Series, defaults to the index of codes (if it's a Series).
+
+    Returns:
+    - labels (Series): Categorical Series with the labels.
+    """
+    if index is None and isinstance(codes, pd.Series):
+        index = codes.index
+
+    categories = [label_map[code] for code in range(len(label_map))]
+    return pd.Series(pd.Categorical.from_codes(np.asarray(codes), categories=categories), index=index)
+
+
+def map_codes(codes, mapping, default):
+    """
+    Translate codes into other codes (e.g. signals into positions) with a lookup table.
+
+    Parameters:
+    - codes (ndarray): Non-negative int8 codes.
+    - mapping (dict): {code: new code}.
+    - default (int/ndarray): New code for all codes that aren't in mapping, a number or one code per row.
+
+    Returns:
+    - codes (ndarray): int8 codes.
+    """
+    codes = np.asarray(codes)
+    size = max(int(codes.max(initial=0)), max(mapping, default=0)) + 1
+
+    # lookup table: -1 marks the codes that get the default
+    table = np.full(size, -1, dtype=np.int8)
+    for code, new_code in mapping.items():
+        table[code] = new_code
+
+    mapped = table[codes]
+    return np.where(mapped >= 0, mapped, default).astype(np.int8)
+
+
+def override(codes, condition, code):
+    """
+    Replace the codes on all rows where condition is True (e.g. a regime filter).
+
+    Returns:
+    - codes (ndarray): int8 codes.
+    """
+    return np.where(np.asarray(condition, dtype=bool), code, codes).astype(np.int8)
+
+
+def select(conditions, choices, default):
+    """
+    Code of the first condition that is True on a row, default if there is none (like np.select, but int8).
+
+    Parameters:
+    - conditions (list): Boolean arrays.
+    - choices (list): One code for each condition.
+    - default (int/ndarray): Code if no condition is True.
+
+    Returns:
+    - codes (ndarray): int8 codes.
+    """
+    codes = np.asarray(default)
+    # go backwards, so the first condition that is True wins
+    for condition, choice in zip(reversed(conditions), reversed(choices)):
+        codes = np.where(np.asarray(condition, dtype=bool), choice, codes)
+
+    return np.asarray(codes).astype(np.int8)
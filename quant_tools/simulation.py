@@ -0,0 +1,109 @@
+"""
+Monte Carlo simulation of strategy returns.
+
+One realized path says little about the tail risk of a strategy. Here many alternative paths are drawn from its
+returns, either by (block) bootstrapping the days, which keeps fat tails and short-term dependence, or from a
+normal distribution with the same mean and volatility. The paths are simulated in chunks (days x paths arrays),
+so memory stays bounded no matter how many paths there are, and the chunks can run in a process pool.
+
+Every chunk has its own seed (spawned from one seed), so the results are the same with any number of processes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from quant_tools.analytics import distribution_stats
+
+
+def simulate_paths(returns, n_paths, n_days=None, method="block", block_size=21, seed=None):
+    """
+    Draw simulated return paths.
+
+    Parameters:
+    - returns (Series/ndarray): Historical returns of the strategy, NaN values are dropped.
+    - n_paths (int): Number of paths.
+    - n_days (int): Length of every path, defaults to the length of the history.
+    - method (str): "block" for a circular block bootstrap, "normal" for normally distributed returns with
+      the mean and standard deviation of the history.
+    - block_size (int): Number of consecutive days per block (1 = plain bootstrap of single days).
+    - seed (int/SeedSequence/Generator): Seed of the random numbers.
+
+    Returns:
+    - paths (ndarray): Simulated returns (days x paths).
+    """
+    values = np.asarray(returns, dtype=np.float64).reshape(-1)
+    values = values[~np.isnan(values)]
+    if n_days is None:
+        n_days = len(values)
+    rng = np.random.default_rng(seed)
+
+    if method == "normal":
+        return rng.normal(values.mean(), values.std(ddof=1), size=(n_days, n_paths))
+    if method != "block":
+        raise ValueError(f"unknown method: {method}")
+
+    # random start of every block, the blocks wrap around the end of the history
+    n_blocks = -(-n_days // block_size)
+    starts = rng.integers(0, len(values), size=(n_blocks, 1, n_paths))
+    days = (starts + np.arange(block_size)[None, :, None]) % len(values)
+
+    return values[days.reshape(n_blocks * block_size, n_paths)[:n_days]]
+
+
+# historical returns of the worker process, set once by _init_worker
+_worker_returns = None
+
+
+def _init_worker(values):
+    global _worker_returns
+    _worker_returns = values
+
+
+def _simulation_task(task, values=None):
+    n_paths, seed, n_days, method, block_size, rfr, log, periods_per_year = task
+    values = _worker_returns if values is None else values
+
+    paths = simulate_paths(values, n_paths, n_days, method, block_size, seed)
+
+    return distribution_stats(paths, rfr, log, periods_per_year)
+
+
+def simulate(returns, n_paths=10000, n_days=None, method="block", block_size=21, rfr=0.0, log=False,
+             periods_per_year=252, seed=None, chunk_size=2000, n_jobs=1):
+    """
+    Distribution of total (terminal) return, Sharpe ratio, max drawdown, skew and kurtosis over simulated paths.
+
+    Parameters:
+    - returns (Series/ndarray): Historical returns of the strategy.
+    - n_paths (int): Number of paths.
+    - n_days (int): Length of every path, defaults to the length of the history.
+    - method (str): "block" (block bootstrap) or "normal" (see simulate_paths).
+    - block_size (int): Number of consecutive days per bootstrap block.
+    - rfr (float): Risk-free rate for the Sharpe ratio.
+    - log (bool): True if the returns are log returns.
+    - periods_per_year (int): Number of periods per year.
+    - seed (int): Seed of the random numbers.
+    - chunk_size (int): Number of paths simulated at once (bounds the memory: days x chunk_size floats).
+    - n_jobs (int): Number of worker processes, 1 runs everything in this process (None = all cores).
+
+    Returns:
+    - results (DataFrame): One row per path with the statistics of quant_tools.analytics.distribution_stats
+      (total_return, annual_return, annual_volatility, sharpe_ratio, max_drawdown, skew, kurtosis),
+      e.g. results.describe() or results.quantile([0.01, 0.05, 0.5]).
+    """
+    values = np.asarray(returns, dtype=np.float64).reshape(-1)
+    values = values[~np.isnan(values)]
+
+    sizes = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(size, chunk_seed, n_days, method, block_size, rfr, log, periods_per_year)
+             for size, chunk_seed in zip(sizes, seeds)]
+
+    if n_jobs == 1 or len(tasks) == 1:
+        outputs = [_simulation_task(task, values) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(values,)) as pool:
+            outputs = list(pool.map(_simulation_task, tasks))
+
+    return pd.DataFrame({name: np.concatenate([output[name] for output in outputs]) for name in outputs[0]})
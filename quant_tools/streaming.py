@@ -0,0 +1,127 @@
+"""
+Streaming ("live") version of the macro strategy of the Summer 2023 sessions:
+long gold if the 10-yr yield went down (or stayed the same) since the last bar, short gold if it went up.
+
+The state is O(1) (last yield and gold price, current position, running P&L and volatility accumulators),
+every new bar updates the signal and the performance without looking at the history again.
+"""
+import asyncio
+
+import numpy as np
+
+
+class MacroSignalStream:
+    """
+    Signal and performance of the 10-yr/gold strategy, updated one bar at a time.
+
+    Parameters:
+    - periods_per_year (int): Number of bars per year, used to annualize the volatility.
+    """
+
+    def __init__(self, periods_per_year=52):
+        self.periods_per_year = periods_per_year
+
+        self.last_yield = None
+        self.last_price = None
+        self.position = 0  # 1 = long gold, -1 = short gold, 0 = before the first bar
+        self.trades = 0
+
+        # running P&L (sum of the log returns) and Welford accumulators of the strategy returns
+        self.log_pnl = 0.0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    @property
+    def volatility(self):
+        """Annualized volatility of the strategy returns so far."""
+        if self.count < 2:
+            return np.nan
+        return np.sqrt(self.m2 / (self.count - 1) * self.periods_per_year)
+
+    def update(self, yield_10y, gold):
+        """
+        Process a new bar.
+
+        The position from the last bar earns the gold return up to this bar, then the new signal is set.
+
+        Parameters:
+        - yield_10y (float): 10-yr yield of the bar.
+        - gold (float): Gold price of the bar.
+
+        Returns:
+        - state (dict): signal, strategy return of this bar, cumulative return, volatility and number of trades.
+        """
+        strategy_return = np.nan
+
+        if self.last_price is not None:
+            # we get the return of the following bar for the signal of the last one
+            with np.errstate(invalid="ignore", divide="ignore"):
+                strategy_return = self.position * np.log(gold / self.last_price)
+
+            # a missing gold price earns nothing (like fillna(0) in the session) and doesn't enter the accumulators
+            if not np.isfinite(strategy_return):
+                strategy_return = 0.0
+            else:
+                self.log_pnl += strategy_return
+
+                self.count += 1
+                delta = strategy_return - self.mean
+                self.mean += delta / self.count
+                self.m2 += delta * (strategy_return - self.mean)
+
+        # 1 if the 10-yr is lower than (or the same as) the bar before, -1 if it's higher
+        # like in the session, the first bar (without a change) is a short signal
+        if self.last_yield is not None and yield_10y - self.last_yield <= 0:
+            signal = 1
+        else:
+            signal = -1
+
+        if self.position != 0 and signal != self.position:
+            self.trades += 1
+
+        self.position = signal
+        self.last_yield = yield_10y
+        # the next return is measured from the last valid gold price
+        if gold is not None and np.isfinite(gold) and gold > 0:
+            self.last_price = gold
+
+        return {
+            "signal": signal,
+            "strategy return": strategy_return,
+            "cumulative return": np.exp(self.log_pnl) - 1,
+            "volatility": self.volatility,
+            "trades": self.trades,
+        }
+
+    async def consume(self, feed):
+        """
+        Process the bars of an async feed as they arrive.
+
+        Parameters:
+        - feed (async iterable): (date, yield_10y, gold) tuples, e.g. replay_feed.
+
+        Yields:
+        - date, state: Date of the bar and the state after it (see update).
+        """
+        async for date, yield_10y, gold in feed:
+            yield date, self.update(yield_10y, gold)
+
+
+async def replay_feed(df, yield_column="10-yr", price_column="gold", delay=0.0):
+    """
+    Replay a DataFrame bar by bar as an async feed (instead of a live data source).
+
+    Parameters:
+    - df (DataFrame): Data with a date index.
+    - yield_column (str): Column with the 10-yr yield.
+    - price_column (str): Column with the gold price.
+    - delay (float): Seconds to wait between two bars.
+
+    Yields:
+    - date, yield_10y, gold: One tuple per bar.
+    """
+    for date, yield_10y, gold in zip(df.index, df[yield_column].to_numpy(), df[price_column].to_numpy()):
+        yield date, yield_10y, gold
+        # gives other tasks (e.g. the consumer) the chance to run between two bars
+        await asyncio.sleep(delay)
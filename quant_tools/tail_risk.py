@@ -0,0 +1,181 @@
+"""
+Value at Risk (VaR) and Expected Shortfall (ES, also called CVaR) for many strategies at once.
+
+Three methods:
+- "historical": empirical quantile of the returns, ES = mean of the returns up to that quantile
+- "gaussian": quantile of a normal distribution with the mean and volatility of the returns
+- "cornish_fisher": the normal quantile corrected for the skew and (excess) kurtosis of the returns
+
+VaR and ES are returns (negative numbers, e.g. -0.03 = a loss of 3%), like the max drawdown of quant_tools.analytics.
+
+VaR and ES only depend on the few lowest returns of a window (3 of 252 days for 99%). The rolling historical
+estimates keep just these lowest returns of every window sorted (for all strategies at once): a new return is
+inserted if it's low enough, and only when one of the lowest returns drops out of the window is that window
+searched again. No window is sorted again from scratch.
+"""
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from quant_tools.analytics import _as_matrix, _output
+
+
+def _historical(ordered, count, level):
+    # VaR (linearly interpolated quantile) and ES (mean of the values up to it) from sorted columns,
+    # the first count values of every column are valid
+    alpha = 1 - level
+    position = (count - 1) * alpha
+    below = np.floor(position).astype(np.int64).clip(0, None)
+    above = np.minimum(below + 1, np.maximum(count - 1, 0))
+
+    lower = np.take_along_axis(ordered, below[None], axis=0)[0]
+    upper = np.take_along_axis(ordered, above[None], axis=0)[0]
+    with np.errstate(invalid="ignore"):
+        var = lower + (position - below) * (upper - lower)
+
+    # only the rows up to the largest needed one are summed
+    tail = np.cumsum(ordered[:below.max() + 1], axis=0)
+    es = np.take_along_axis(tail, below[None], axis=0)[0] / (below + 1)
+
+    valid = count > 0
+    return np.where(valid, var, np.nan), np.where(valid, es, np.nan)
+
+
+def _parametric(mean, std, skew, kurtosis, level, method):
+    # VaR and ES of a normal (gaussian) or Cornish-Fisher expanded distribution
+    alpha = 1 - level
+    z = norm.ppf(alpha)
+
+    if method == "gaussian":
+        return mean + std * z, mean - std * norm.pdf(z) / alpha
+    if method != "cornish_fisher":
+        raise ValueError(f"unknown method: {method}")
+
+    with np.errstate(invalid="ignore"):
+        quantile = z + (z ** 2 - 1) * skew / 6 + (z ** 3 - 3 * z) * kurtosis / 24 - (2 * z ** 3 - 5 * z) * skew ** 2 / 36
+
+        # ES = average of the expanded quantiles below alpha, the integral of the polynomial over the normal tail
+        tail = norm.pdf(z) / alpha * (-1 - z * skew / 6 + (1 - z ** 2) * kurtosis / 24 - (1 - 2 * z ** 2) * skew ** 2 / 36)
+
+    return mean + std * quantile, mean + std * tail
+
+
+def _moments(count, total, total_sq, total_cube, total_quad, center):
+    # mean, standard deviation (ddof=1), skew and excess kurtosis from power sums of centered values
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        m2 = np.maximum(total_sq / count - mean ** 2, 0.0)
+        m3 = total_cube / count - 3 * mean * total_sq / count + 2 * mean ** 3
+        m4 = total_quad / count - 4 * mean * total_cube / count + 6 * mean ** 2 * total_sq / count - 3 * mean ** 4
+
+        std = np.sqrt(m2 * count / (count - 1))
+        skew = m3 / m2 ** 1.5
+        kurtosis = m4 / m2 ** 2 - 3
+
+    return mean + center, std, skew, kurtosis
+
+
+def var_es(returns, level=0.99, method="historical"):
+    """
+    Value at Risk and Expected Shortfall over the whole sample.
+
+    Parameters:
+    - returns (Series/DataFrame/ndarray): Returns (days x strategies), NaN values are skipped.
+    - level (float): Confidence level, e.g. 0.99 for the 1% worst days.
+    - method (str): "historical", "gaussian" or "cornish_fisher".
+
+    Returns:
+    - var (float/Series/ndarray): Value at Risk of each strategy (a return, negative for a loss).
+    - es (float/Series/ndarray): Expected Shortfall of each strategy (the mean return beyond the VaR).
+    """
+    values, _ = _as_matrix(returns)
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+
+    if method == "historical":
+        # NaN values are sorted to the end of every column
+        var, es = _historical(np.sort(values, axis=0), count, level)
+    else:
+        center = np.nanmean(values, axis=0)
+        x = np.where(valid, values - center, 0.0)
+        moments = _moments(count, x.sum(axis=0), (x ** 2).sum(axis=0), (x ** 3).sum(axis=0), (x ** 4).sum(axis=0), center)
+        var, es = _parametric(*moments, level, method)
+
+    return _output(var, returns), _output(es, returns)
+
+
+def rolling_var_es(returns, window=252, level=0.99, method="historical", min_periods=None):
+    """
+    Value at Risk and Expected Shortfall over a rolling window (e.g. 1 year), for every day.
+
+    The historical method keeps the lowest returns of every window sorted, the parametric methods use rolling
+    power sums, so no window is sorted or summed again.
+
+    Parameters:
+    - returns (Series/DataFrame/ndarray): Returns (days x strategies), NaN values are skipped.
+    - window (int): Number of days in the window.
+    - level (float): Confidence level.
+    - method (str): "historical", "gaussian" or "cornish_fisher".
+    - min_periods (int): Number of returns a window needs, defaults to window.
+
+    Returns:
+    - var (same type as returns): Value at Risk of the window ending on each day, NaN without enough data.
+    - es (same type as returns): Expected Shortfall of the window ending on each day.
+    """
+    values, _ = _as_matrix(returns)
+    valid = ~np.isnan(values)
+    if min_periods is None:
+        min_periods = window
+
+    count = np.cumsum(valid, axis=0)
+    count[window:] -= count[:-window].copy()
+
+    if method == "historical":
+        var, es = np.full(values.shape, np.nan), np.full(values.shape, np.nan)
+
+        # the lowest returns of every window, enough for the quantile and its interpolation partner,
+        # and the day of each of them (-1 = empty), missing values are +inf so they're never part of it
+        size = min(window, int(np.floor((window - 1) * (1 - level))) + 2)
+        tail = np.full((size, values.shape[1]), np.inf)
+        tail_day = np.full(tail.shape, -1)
+        rows = np.arange(size)[:, None]
+        padded = np.where(valid, values, np.inf)
+
+        for day in range(len(values)):
+            # insert the new return at its place if it's low enough (the highest one of the tail drops out)
+            new = padded[day]
+            position = (tail <= new).sum(axis=0)
+            tail = np.where(rows < position, tail, np.where(rows == position, new, np.vstack([tail[:1], tail[:-1]])))
+            tail_day = np.where(rows < position, tail_day, np.where(rows == position, day, np.vstack([tail_day[:1], tail_day[:-1]])))
+
+            # search the window again where one of the lowest returns leaves it
+            refill = np.flatnonzero((tail_day == day - window).any(axis=0)) if day >= window else []
+            if len(refill):
+                block = padded[day - window + 1:day + 1, refill]
+                order = np.argsort(block, axis=0, kind="stable")[:size]
+                tail[:, refill] = np.take_along_axis(block, order, axis=0)
+                tail_day[:, refill] = order + day - window + 1
+
+            var[day], es[day] = _historical(tail, count[day], level)
+    else:
+        center = np.nanmean(values, axis=0)
+        x = np.where(valid, values - center, 0.0)
+        sums = []
+        for power in range(1, 5):
+            total = np.cumsum(x ** power, axis=0)
+            total[window:] -= total[:-window].copy()
+            sums.append(total)
+        var, es = _parametric(*_moments(count, *sums, center), level, method)
+
+    enough = count >= max(min_periods, 2)
+    var, es = np.where(enough, var, np.nan), np.where(enough, es, np.nan)
+
+    if isinstance(returns, pd.DataFrame):
+        return (pd.DataFrame(var, index=returns.index, columns=returns.columns),
+                pd.DataFrame(es, index=returns.index, columns=returns.columns))
+    if isinstance(returns, pd.Series):
+        return pd.Series(var[:, 0], index=returns.index, name=returns.name), pd.Series(es[:, 0], index=returns.index, name=returns.name)
+    if np.ndim(returns) == 1:
+        return var[:, 0], es[:, 0]
+
+    return var, es